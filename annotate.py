@@ -0,0 +1,107 @@
+import numpy
+import pygame
+
+# Annotation tools.
+BLUR = "blur"
+PIXELATE = "pixelate"
+HIGHLIGHT = "highlight"
+
+# Box blur radius (px); wide enough that text underneath can no longer be read.
+BLUR_RADIUS = 12
+# Side (px) of pixelation blocks.
+PIXEL_SIZE = 12
+HIGHLIGHT_COLOR = (255, 230, 0)
+HIGHLIGHT_ALPHA = 0.35
+
+# Mean of the (2 * radius + 1) px square around each pixel of box (left, upper, right, lower) of pixels,
+# from an integral image (summed area table, built one axis at a time so sums fit int32),
+# so cost does not depend on radius. Squares are cut at image edges, and averaged over the pixels left.
+def box_blur(pixels, box, radius=BLUR_RADIUS):
+    left, upper, right, lower = box
+    height, width = pixels.shape[:2]
+    # Only the box and the pixels within radius of it are summed.
+    outer_left, outer_upper = max(0, left - radius), max(0, upper - radius)
+    outer_right, outer_lower = min(width, right + radius), min(height, lower + radius)
+
+    # Edges of each pixel's square, as rows and columns of the summed area.
+    rows = numpy.arange(upper, lower)
+    columns = numpy.arange(left, right)
+    top = numpy.clip(rows - radius, outer_upper, outer_lower) - outer_upper
+    bottom = numpy.clip(rows + radius + 1, outer_upper, outer_lower) - outer_upper
+    first = numpy.clip(columns - radius, outer_left, outer_right) - outer_left
+    last = numpy.clip(columns + radius + 1, outer_left, outer_right) - outer_left
+
+    # Sums down each column of square, then across.
+    sums = numpy.zeros((outer_lower - outer_upper + 1, outer_right - outer_left, 3), dtype=numpy.int32)
+    sums[1:] = pixels[outer_upper:outer_lower, outer_left:outer_right]
+    # Adding whole rows is several times faster than numpy.cumsum down axis 0.
+    for row in range(1, len(sums)):
+        numpy.add(sums[row - 1], sums[row], out=sums[row])
+    column_sums = sums.take(bottom, axis=0) - sums.take(top, axis=0)
+    sums = numpy.zeros((lower - upper, outer_right - outer_left + 1, 3), dtype=numpy.int32)
+    numpy.cumsum(column_sums, axis=1, out=sums[:, 1:])
+    sums = sums.take(last, axis=1) - sums.take(first, axis=1)
+
+    scale = 1 / ((bottom - top)[:, None] * (last - first)[None, :]).astype(numpy.float32)
+    means = numpy.multiply(sums, scale[:, :, None], dtype=numpy.float32)
+    pixels[upper:lower, left:right] = numpy.rint(means, out=means)
+
+# Replace each PIXEL_SIZE square of box (aligned to box) by its mean color.
+def pixelate(pixels, box, size=PIXEL_SIZE):
+    left, upper, right, lower = box
+    region = pixels[upper:lower, left:right]
+    starts_y = numpy.arange(0, lower - upper, size)
+    starts_x = numpy.arange(0, right - left, size)
+    sums = numpy.add.reduceat(numpy.add.reduceat(region, starts_y, axis=0, dtype=numpy.uint32), starts_x, axis=1)
+    # Blocks at the far edges may be smaller.
+    sizes_y = numpy.diff(numpy.append(starts_y, lower - upper))
+    sizes_x = numpy.diff(numpy.append(starts_x, right - left))
+    means = (sums // (sizes_y[:, None] * sizes_x[None, :])[:, :, None]).astype(numpy.uint8)
+    region[:] = numpy.repeat(numpy.repeat(means, sizes_y, axis=0), sizes_x, axis=1)
+
+# Blend box with a translucent color, in 8 bit fixed point.
+def highlight(pixels, box, color=HIGHLIGHT_COLOR, alpha=HIGHLIGHT_ALPHA):
+    left, upper, right, lower = box
+    region = pixels[upper:lower, left:right]
+    weight = round(alpha * 256)
+    blended = region * numpy.uint16(256 - weight) + (numpy.array(color, dtype=numpy.uint16) * weight + 128)
+    region[:] = blended >> 8
+
+TOOLS = {BLUR: box_blur, PIXELATE: pixelate, HIGHLIGHT: highlight}
+
+# Edits of a crop, applied in place to the pixels of its (24 or 32-bit) surface, so no other copy
+# of the crop is kept. Undo stack keeps only the pixels each edit replaced.
+class Annotator():
+    def __init__(self, surface):
+        self.surface = surface
+        self.undo_stack = []
+
+    # Surface pixels as (height, width, 3) array, locking surface until the array is released.
+    def get_pixels(self):
+        return pygame.surfarray.pixels3d(self.surface).swapaxes(0, 1)
+
+    # Apply tool to box (left, upper, right, lower; crop px). Returns box changed, or None if empty.
+    def apply(self, tool, box):
+        width, height = self.surface.get_size()
+        left, upper = max(0, min(box[0], box[2])), max(0, min(box[1], box[3]))
+        right, lower = min(width, max(box[0], box[2])), min(height, max(box[1], box[3]))
+        if right <= left or lower <= upper:
+            return None
+        box = (left, upper, right, lower)
+        pixels = self.get_pixels()
+        self.undo_stack.append((box, pixels[upper:lower, left:right].copy()))
+        TOOLS[tool](pixels, box)
+        return box
+
+    # Undo last edit. Returns box changed, or None if nothing to undo.
+    def undo(self):
+        if not self.undo_stack:
+            return None
+        box, old = self.undo_stack.pop()
+        left, upper, right, lower = box
+        self.get_pixels()[upper:lower, left:right] = old
+        return box
+
+    # Bytes held by undo stack.
+    def get_bytes(self):
+        return sum(old.nbytes for _, old in self.undo_stack)
@@ -0,0 +1,128 @@
+# Headless batch cropping: cut many rectangles out of captured images, across a process pool.
+# Usage: python batch.py IMAGE_OR_DIR [...] --rect LEFT,UPPER,RIGHT,LOWER [...] [--rects FILE]
+#                        [--scale FACTOR] [--format PNG] [--out DIR] [--jobs N]
+# Each finished crop is printed as one JSON line as soon as it is written.
+import argparse
+import hashlib
+import json
+import math
+import os
+import sys
+from multiprocessing import Pool, cpu_count
+
+from PIL import Image
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff", ".webp")
+
+# "left,upper,right,lower" to crop rectangle with corners in order.
+def parse_rect(text):
+    left, upper, right, lower = [int(value) for value in text.replace(" ", ",").split(",") if value]
+    return {"left": min(left, right), "upper": min(upper, lower),
+            "right": max(left, right), "lower": max(upper, lower)}
+
+def read_rects(path):
+    with open(path, "r") as f:
+        return [parse_rect(line) for line in f if line.strip() and not line.startswith("#")]
+
+# Rect as (left, upper, right, lower), the shape given in every result.
+def to_box(rect):
+    return (rect["left"], rect["upper"], rect["right"], rect["lower"])
+
+# Crop box of rect in image of size, or None if rect is empty or not inside image.
+# Unlike a click in the snipping window, nothing here falls back to 1 pixel.
+def get_box(rect, size):
+    box = to_box(rect)
+    if box[0] < 0 or box[1] < 0 or box[2] > size[0] or box[3] > size[1] or box[0] >= box[2] or box[1] >= box[3]:
+        return None
+    return box
+
+# Output file name stem of each image: its own stem, made unique with a hash of its path
+# when images in different directories share a name.
+def get_stems(images):
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in images]
+    return [stem if stems.count(stem) == 1 else "%s_%s" % (stem, hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:8])
+            for stem, path in zip(stems, images)]
+
+# Image files from files and directories given, each once (in order first given),
+# so no two processes write the same output file.
+def find_images(paths):
+    images = []
+    for path in paths:
+        if os.path.isdir(path):
+            images.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            images.append(path)
+    unique = {}
+    for path in images:
+        unique.setdefault(os.path.abspath(path), path)
+    return list(unique.values())
+
+# Crop, scale and save rectangles from one image. Image is decoded once per chunk.
+def crop_chunk(task):
+    path, stem, rects, scale, image_format, out_dir = task
+    results = []
+    try:
+        image = Image.open(path)
+        image.load()
+    except OSError as error:
+        return [{"image": path, "rect": to_box(rect), "error": str(error)} for rect in rects]
+
+    for rect in rects:
+        box = get_box(rect, image.size)
+        if box == None:
+            results.append({"image": path, "rect": to_box(rect), "error": "rectangle is empty or not inside %dx%d image" % image.size})
+            continue
+        name = "%s_%d_%d_%d_%d.%s" % (stem, box[0], box[1], box[2], box[3], image_format.lower())
+        output = os.path.join(out_dir, name)
+        try:
+            cropped = image.crop(box)
+            if scale != 1:
+                size = (max(1, round(cropped.width * scale)), max(1, round(cropped.height * scale)))
+                cropped = cropped.resize(size, Image.LANCZOS if scale < 1 else Image.NEAREST)
+            cropped.save(output, image_format)
+            results.append({"image": path, "rect": box, "output": output, "size": cropped.size})
+        except (OSError, ValueError) as error:
+            results.append({"image": path, "rect": box, "error": str(error)})
+    return results
+
+# Split work into chunks of rectangles per image: big enough to decode each image rarely,
+# small enough to keep every process busy and results streaming.
+def make_tasks(images, rects, scale, image_format, out_dir, jobs):
+    chunk = max(1, math.ceil(len(images) * len(rects) / (jobs * 4)))
+    chunk = min(chunk, len(rects))
+    return [(path, stem, rects[start:start + chunk], scale, image_format, out_dir)
+            for path, stem in zip(images, get_stems(images)) for start in range(0, len(rects), chunk)]
+
+# Crop all rectangles from all images. Yields results as they finish.
+def run(images, rects, scale=1, image_format="PNG", out_dir=".", jobs=None):
+    jobs = jobs or cpu_count()
+    os.makedirs(out_dir, exist_ok=True)
+    tasks = make_tasks(images, rects, scale, image_format, out_dir, jobs)
+    with Pool(jobs) as pool:
+        for results in pool.imap_unordered(crop_chunk, tasks):
+            for result in results:
+                yield result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Crop rectangles out of images without a display.")
+    parser.add_argument("inputs", nargs="+", help="image files or directories of images")
+    parser.add_argument("--rect", action="append", default=[], type=parse_rect, help="LEFT,UPPER,RIGHT,LOWER")
+    parser.add_argument("--rects", help="file with one LEFT,UPPER,RIGHT,LOWER per line")
+    parser.add_argument("--scale", type=float, default=1, help="scale factor for crops")
+    parser.add_argument("--format", default="PNG", help="output image format")
+    parser.add_argument("--out", default="crops", help="output directory")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: cores)")
+    args = parser.parse_args(argv)
+
+    # Each rectangle once, for the same reason as images.
+    rects = list({to_box(rect): rect for rect in args.rect + (read_rects(args.rects) if args.rects else [])}.values())
+    if not rects:
+        parser.error("no rectangles given (use --rect or --rects)")
+    failed = 0
+    for result in run(find_images(args.inputs), rects, args.scale, args.format, args.out, args.jobs):
+        failed += "error" in result
+        print(json.dumps(result), flush=True)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
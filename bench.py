@@ -0,0 +1,205 @@
+# Benchmarks for startup, capture-to-display latency, zoom and main loop frame time.
+# Runs headless with a synthetic capture source in place of the screen.
+# Usage: python bench.py [--screens 1080p,4k,triple-4k] [--repeat N] [--out FILE] [--compare OLD_FILE]
+# Results are written as JSON (with pixel memory held by snips); --compare prints change in median time
+# against an older result file.
+import os
+# No window needed; must be set before pygame is imported.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import pygame
+
+from snip import Snip, State, SCREEN_COLOR
+from menu import Toolbar
+from clipboard import encode_dib
+from zoom import ZoomView, MAX_ZOOM
+from settings import get_settings
+from capture import SyntheticSource, set_capture_source
+
+SCREEN_SIZES = {"1080p": (1920, 1080), "4k": (3840, 2160), "triple-4k": (11520, 2160)}
+# Crop sizes, from tiny to full screen (None).
+CROP_SIZES = {"tiny": (16, 16), "small": (256, 256), "medium": (1280, 720), "full": None}
+
+# Seconds taken by each of repeat calls to func. setup() runs untimed before each call.
+def measure(func, repeat, setup=None):
+    samples = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        func(state)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def summarize(case, samples, **params):
+    result = {"case": case}
+    result.update(params)
+    result.update({"samples": len(samples),
+                    "min_ms": round(min(samples) * 1000, 3),
+                    "median_ms": round(statistics.median(samples) * 1000, 3),
+                    "mean_ms": round(statistics.mean(samples) * 1000, 3)})
+    return result
+
+# Pixel memory held by snip.
+def summarize_memory(current_snip, **params):
+    result = {"case": "memory"}
+    result.update(params)
+    result.update({name + "_mb": round(size / 1024 / 1024, 3) for name, size in current_snip.get_memory().items()})
+    return result
+
+def get_crop_rectangle(screen_size, crop_size):
+    if crop_size == None:
+        return {"left": 0, "upper": 0, "right": screen_size[0], "lower": screen_size[1]}
+    left = (screen_size[0] - crop_size[0]) // 2
+    upper = (screen_size[1] - crop_size[1]) // 2
+    return {"left": left, "upper": upper, "right": left + crop_size[0], "lower": upper + crop_size[1]}
+
+# Snip taken up to first CROPPED frame.
+def make_cropped_snip(screen_size, crop_size):
+    current_snip = Snip()
+    current_snip.crop_rectangle = get_crop_rectangle(screen_size, crop_size)
+    current_snip.state = State.CROP
+    current_snip.update(pygame.display.get_surface())
+    return current_snip
+
+# One main loop frame: what main.main draws when it redraws.
+def draw_frame(current_snip, toolbar, full=True):
+    window = pygame.display.get_surface()
+    if full:
+        window.fill(SCREEN_COLOR)
+    dirty_rects = current_snip.update(window, full)
+    toolbar.update(window, False)
+    if dirty_rects == None:
+        pygame.display.update()
+    else:
+        pygame.display.update(dirty_rects)
+
+def bench_screen(name, screen_size, repeat):
+    results = []
+    set_capture_source(SyntheticSource(screen_size))
+    pygame.display.set_mode((700, 600))
+
+    # Screen grab to first SNIPPING frame.
+    samples = measure(lambda state: Snip().update(pygame.display.get_surface()), repeat)
+    results.append(summarize("capture", samples, screen=name))
+
+    toolbar = Toolbar()
+    current_snip = Snip()
+    results.append(summarize_memory(current_snip, screen=name))
+    toolbar.visible = False
+    samples = measure(lambda state: draw_frame(current_snip, toolbar, False), repeat)
+    results.append(summarize("frame_snipping", samples, screen=name))
+    current_snip.set_left_upper((10, 10))
+    current_snip.state = State.CROPPING
+    draw_frame(current_snip, toolbar)
+    samples = measure(lambda state: draw_frame(current_snip, toolbar, False), repeat)
+    results.append(summarize("frame_cropping", samples, screen=name))
+
+    for crop_name, crop_size in CROP_SIZES.items():
+        # mouseUp to first CROPPED frame (crop, surface conversion, first draw).
+        def setup():
+            current_snip = Snip()
+            current_snip.crop_rectangle = get_crop_rectangle(screen_size, crop_size)
+            current_snip.state = State.CROP
+            return current_snip
+        samples = measure(lambda current_snip: current_snip.update(pygame.display.get_surface()), repeat, setup)
+        results.append(summarize("crop_to_display", samples, screen=name, crop=crop_name))
+
+        current_snip = make_cropped_snip(screen_size, crop_size)
+        results.append(summarize_memory(current_snip, screen=name, crop=crop_name))
+        samples = measure(lambda state: encode_dib(current_snip.cropped_pic), repeat)
+        results.append(summarize("encode_clipboard", samples, screen=name, crop=crop_name))
+
+        toolbar.visible = True
+        samples = measure(lambda state: draw_frame(current_snip, toolbar), repeat)
+        results.append(summarize("frame_cropped", samples, screen=name, crop=crop_name))
+
+        # Zoom step and first draw at each zoom depth, with cold tile cache.
+        step = get_settings().zoom_step
+        zoom = 1
+        while zoom * step <= MAX_ZOOM:
+            def setup(zoom=zoom):
+                current_snip.zoom_view = ZoomView(current_snip.cropped_img, get_settings().memory_budget_mb * 1024 * 1024)
+                current_snip.zoom_scale = zoom
+                current_snip.pan_offset = (0, 0)
+            def zoom_in(state):
+                # Zoom at window center (headless mouse is at 0, 0), so zoomed image stays in view.
+                window = pygame.display.get_surface()
+                current_snip.increment_zoom(step, (window.get_width() // 2, window.get_height() // 2))
+                current_snip.cropped(window)
+            samples = measure(zoom_in, repeat, setup)
+            results.append(summarize("zoom", samples, screen=name, crop=crop_name, zoom=round(zoom * step, 3)))
+            zoom *= step
+    return results
+
+# Toolbar creation and drawing (menu.py), independent of screen size.
+def bench_menu(repeat):
+    pygame.display.set_mode((700, 600))
+    results = [summarize("toolbar_create", measure(lambda state: Toolbar(), repeat))]
+    toolbar = Toolbar()
+    samples = measure(lambda state: toolbar.update(pygame.display.get_surface(), False), repeat)
+    results.append(summarize("toolbar_draw", samples))
+    return results
+
+# Process start to first frame of main window, in a fresh interpreter.
+def bench_startup(repeat):
+    directory = os.path.dirname(os.path.abspath(__file__))
+    def run(state):
+        subprocess.run([sys.executable, "-c", "import main; main.main(first_frame_only=True)"],
+                        cwd=directory, capture_output=True, check=True)
+    return [summarize("startup", measure(run, repeat))]
+
+def get_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return None
+
+def get_key(result):
+    return tuple((name, result[name]) for name in ("case", "screen", "crop", "zoom") if name in result)
+
+# Print change in median time of each case, against older results.
+def compare(results, old_path):
+    with open(old_path, "r") as f:
+        old = {get_key(result): result for result in json.load(f)["results"]}
+    for result in results:
+        before = old.get(get_key(result))
+        if before == None or before.get("median_ms", 0) == 0:
+            continue
+        change = (result["median_ms"] - before["median_ms"]) / before["median_ms"] * 100
+        label = " ".join(str(value) for _, value in get_key(result))
+        print("%-45s %10.3f ms -> %10.3f ms  %+7.1f%%" % (label, before["median_ms"], result["median_ms"], change))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Snippy capture, crop, zoom and frame times.")
+    parser.add_argument("--screens", default=",".join(SCREEN_SIZES), help="comma separated screen sizes")
+    parser.add_argument("--repeat", type=int, default=5, help="samples per case")
+    parser.add_argument("--out", default="bench_output.txt", help="JSON result file")
+    parser.add_argument("--compare", help="older JSON result file to compare against")
+    args = parser.parse_args(argv)
+
+    pygame.display.init()
+    results = bench_startup(args.repeat) + bench_menu(args.repeat)
+    for name in args.screens.split(","):
+        results += bench_screen(name, SCREEN_SIZES[name], args.repeat)
+        print("benchmarked", name, file=sys.stderr)
+    pygame.display.quit()
+
+    with open(args.out, "w") as f:
+        json.dump({"commit": get_commit(), "python": platform.python_version(), "pygame": pygame.version.ver,
+                    "platform": platform.platform(), "repeat": args.repeat, "results": results}, f, indent=1)
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
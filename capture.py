@@ -0,0 +1,120 @@
+import threading
+import time
+
+import numpy
+from PIL import Image
+from settings import get_settings
+from timing import stage
+
+# Capture sources. grab(bbox=None) returns the screen (or bbox = (left, upper, right, lower)
+# part of it) as a PIL image. live is True if grab captures the screen at that moment, so the
+# Snippy window must be hidden first.
+
+# Screen, through PIL ImageGrab (loaded on first grab, not at startup).
+class ScreenSource():
+    live = True
+
+    def grab(self, bbox=None):
+        from PIL import ImageGrab
+        return ImageGrab.grab(bbox=bbox)
+
+    def close(self):
+        pass
+
+# Deterministic in-process image of given size, for tests and benchmarks without a display.
+class SyntheticSource():
+    live = False
+
+    def __init__(self, size=(1920, 1080)):
+        width, height = size
+        red = Image.linear_gradient("L").resize((width, height))
+        green = Image.radial_gradient("L").resize((width, height))
+        # Noise from a generator seeded by size (Image.effect_noise uses process-wide C rand() state),
+        # so every source of a size has the same pixels, in any process.
+        noise = numpy.random.default_rng(size).normal(128, 64, (256, 256))
+        blue = Image.fromarray(numpy.clip(noise, 0, 255).astype(numpy.uint8)).resize((width, height))
+        self.image = Image.merge("RGB", (red, green, blue))
+
+    def grab(self, bbox=None):
+        if bbox != None:
+            return self.image.crop(bbox)
+        return self.image.copy()
+
+    def close(self):
+        pass
+
+# Keeps a recent frame of another source ready, grabbed every interval seconds by a background
+# thread, so a new snip starts from memory at once. Frame may be up to interval old, and may
+# include the Snippy window (it is not hidden for background grabs).
+# If the kept frame is older than STALE_INTERVALS intervals (e.g. grabbing failed), grab
+# falls back to grabbing from source directly.
+class BackgroundSource():
+    live = False
+    STALE_INTERVALS = 3
+
+    def __init__(self, source, interval=0.5):
+        self.source = source
+        self.interval = interval
+        # Latest frame and when it was grabbed, shared with grabbing thread.
+        # Frames are never modified, only replaced.
+        self.frame = None
+        self.frame_time = 0
+        # Last error of a background grab, if any.
+        self.error = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="snippy-capture", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.is_set():
+            start = time.monotonic()
+            try:
+                with stage("background_grab"):
+                    frame = self.source.grab()
+                with self.lock:
+                    self.frame = frame
+                    self.frame_time = time.monotonic()
+            except Exception as error:
+                self.error = error # try again next interval; grab falls back if frame gets stale
+            self.stopped.wait(max(0, self.interval - (time.monotonic() - start)))
+
+    def grab(self, bbox=None):
+        with self.lock:
+            frame = self.frame
+            age = time.monotonic() - self.frame_time
+        if frame == None or age > self.STALE_INTERVALS * self.interval:
+            # Nothing grabbed yet, or background grabs keep failing.
+            return self.source.grab(bbox)
+        if bbox != None:
+            return frame.crop(bbox)
+        return frame
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.source.close()
+
+# Source that grabs the screen as it is now (not a kept background frame).
+def get_direct_source(source):
+    if isinstance(source, BackgroundSource):
+        return source.source
+    return source
+
+capture_source = None
+
+def get_capture_source():
+    global capture_source
+    if capture_source == None:
+        settings = get_settings()
+        capture_source = ScreenSource()
+        if settings.prewarm_capture:
+            capture_source = BackgroundSource(capture_source, settings.prewarm_interval_ms / 1000)
+    return capture_source
+
+# Plug in a different source (closing the previous one).
+def set_capture_source(source):
+    global capture_source
+    if capture_source != None and capture_source is not source:
+        capture_source.close()
+    capture_source = source
@@ -0,0 +1,52 @@
+from io import BytesIO
+
+# Clipboard backends. The Windows clipboard is used when pywin32 is installed, otherwise
+# a fake clipboard keeps the last payload in memory (other platforms, headless runs).
+
+# Encode image as a device independent bitmap (BMP without its 14 byte file header).
+def encode_dib(img):
+    output = BytesIO()
+    img.convert("RGB").save(output, "BMP")
+    data = output.getvalue()[14:]
+    output.close()
+    return data
+
+# save to windows clipboard
+class WindowsClipboard():
+    def __init__(self):
+        import win32clipboard
+        import win32con
+        self.clip = win32clipboard
+        self.format = win32con.CF_DIB
+
+    def publish(self, data):
+        self.clip.OpenClipboard()
+        try:
+            self.clip.EmptyClipboard()
+            self.clip.SetClipboardData(self.format, data)
+        finally:
+            self.clip.CloseClipboard()
+
+# Holds last published payload.
+class FakeClipboard():
+    def __init__(self):
+        self.data = None
+
+    def publish(self, data):
+        self.data = data
+
+clipboard = None
+
+def get_clipboard():
+    global clipboard
+    if clipboard == None:
+        try:
+            clipboard = WindowsClipboard()
+        except ImportError:
+            clipboard = FakeClipboard()
+    return clipboard
+
+# Plug in a different backend.
+def set_clipboard(backend):
+    global clipboard
+    clipboard = backend
@@ -0,0 +1,55 @@
+import numpy
+
+# Brightness step (0-255) between neighbouring pixels that counts as an edge.
+EDGE_THRESHOLD = 24
+# Length (px) along which edge pixels must line up to count as a strong edge (e.g. a window border).
+EDGE_LENGTH = 16
+
+# Strong edge positions of a capture, found once in a vectorized pass over the whole image.
+# vertical[y, x] is True if a vertical edge runs between columns x - 1 and x near row y;
+# horizontal[y, x] likewise for a horizontal edge between rows y - 1 and y near column x.
+# Nearest edge to a point is found by scanning only the square of radius pixels around it,
+# so lookup cost does not depend on capture size.
+class EdgeIndex():
+    def __init__(self, img):
+        gray = numpy.asarray(img.convert("L"), dtype=numpy.int16)
+        height, width = gray.shape
+        self.vertical = numpy.zeros((height, width), dtype=bool)
+        self.horizontal = numpy.zeros((height, width), dtype=bool)
+        self.vertical[:, 1:] = self.get_strong(numpy.abs(numpy.diff(gray, axis=1)) > EDGE_THRESHOLD, axis=0)
+        self.horizontal[1:, :] = self.get_strong(numpy.abs(numpy.diff(gray, axis=0)) > EDGE_THRESHOLD, axis=1)
+
+    # Pixels with at least half of the EDGE_LENGTH pixels around them (along axis) edges,
+    # so edges still count up to their ends (window corners).
+    def get_strong(self, edges, axis):
+        half = EDGE_LENGTH // 2
+        edges = numpy.moveaxis(edges, axis, 0)
+        # Running count of edge pixels (fits int16 up to 32767 px), clamped past both ends,
+        # so each window is one subtraction.
+        counts = numpy.cumsum(edges, axis=0, dtype=numpy.int16)
+        before = numpy.zeros((half + 1,) + counts.shape[1:], dtype=numpy.int16)
+        after = numpy.repeat(counts[-1:], half, axis=0)
+        counts = numpy.concatenate([before, counts, after])
+        window = counts[2 * half:] - counts[:-2 * half]
+        return numpy.moveaxis(window[:edges.shape[0]] * 2 >= EDGE_LENGTH, 0, axis)
+
+    # Index nearest to center of those True in line, or None.
+    def nearest(self, line, center):
+        found = numpy.flatnonzero(line)
+        if found.size == 0:
+            return None
+        return int(found[numpy.argmin(numpy.abs(found - center))])
+
+    # Point (capture px) moved to nearest strong vertical and horizontal edges within radius.
+    # Edges anywhere in the (2 * radius + 1) px square around point count, so a corner approached
+    # from outside (where neither edge passes through point's row or column) still snaps.
+    def snap(self, point, radius):
+        height, width = self.vertical.shape
+        x = min(max(point[0], 0), width - 1)
+        y = min(max(point[1], 0), height - 1)
+        left, upper = max(0, x - radius), max(0, y - radius)
+        right, lower = min(width, x + radius + 1), min(height, y + radius + 1)
+        # Columns with a vertical edge, and rows with a horizontal edge, somewhere in square.
+        snapped_x = self.nearest(self.vertical[upper:lower, left:right].any(axis=0), x - left)
+        snapped_y = self.nearest(self.horizontal[upper:lower, left:right].any(axis=1), y - upper)
+        return (point[0] if snapped_x == None else left + snapped_x, point[1] if snapped_y == None else upper + snapped_y)
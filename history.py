@@ -0,0 +1,71 @@
+import zlib
+
+from PIL import Image
+from worker import get_worker
+
+# A snip kept in history: 24-bit pixels packed and zlib compressed in background.
+class HistoryEntry():
+    def __init__(self, img):
+        self.last_used = 0
+        self.set_image(img)
+
+    # Replace pixels of entry (e.g. with the annotated crop), compressed in background.
+    def set_image(self, img):
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        self.size = img.size
+        # Fast compression level: screen captures compress well even at level 1.
+        self.data = get_worker().submit("history", zlib.compress, img.tobytes(), 1)
+
+    def get_bytes(self):
+        return len(self.data.result())
+
+    def get_image(self):
+        return Image.frombytes("RGB", self.size, zlib.decompress(self.data.result()))
+
+# Recent snips in memory, oldest first, within a byte budget.
+# Least recently used snips are evicted first (never the one being viewed).
+class SnipHistory():
+    def __init__(self, budget):
+        self.budget = budget
+        self.entries = []
+        self.position = -1
+        self.uses = 0
+
+    def add(self, img):
+        entry = HistoryEntry(img)
+        self.entries.append(entry)
+        self.position = len(self.entries) - 1
+        self.use(entry)
+        self.trim()
+        return entry
+
+    def use(self, entry):
+        self.uses += 1
+        entry.last_used = self.uses
+
+    # Bytes held by compressed entries.
+    def get_bytes(self):
+        return sum(entry.get_bytes() for entry in self.entries if entry.data.done())
+
+    # Evict least recently used entries until within budget.
+    # Called again when an entry finishes compressing; entries still compressing are not counted or evicted.
+    def trim(self):
+        while self.get_bytes() > self.budget:
+            current = self.entries[self.position]
+            done = [entry for entry in self.entries if entry is not current and entry.data.done()]
+            if not done:
+                break
+            oldest = min(done, key=lambda entry: entry.last_used)
+            self.entries.remove(oldest)
+            self.position = self.entries.index(current)
+
+    # Move back (-1) or forward (1) in history. Returns entry moved to, or None if at either end.
+    def step(self, direction):
+        position = self.position + direction
+        if position < 0 or position >= len(self.entries):
+            return None
+        self.position = position
+        entry = self.entries[position]
+        self.use(entry)
+        return entry
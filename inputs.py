@@ -0,0 +1,37 @@
+import pygame
+from settings import get_settings
+from snip import State
+
+# Collects zoom and pan input of one frame and applies it once:
+# all zoom steps become one net zoom factor, all mouse motion one final pan position.
+class InputCoalescer():
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.zoom_factor = 1
+        self.zoom_anchor = None
+        self.mouse_pos = None
+
+    def feed(self, event):
+        step = get_settings().zoom_step
+        if event.type == pygame.MOUSEMOTION:
+            self.mouse_pos = event.pos
+        # set zoom in and out with mouse wheel (zoom at mouse), or keys.
+        elif (event.type == pygame.KEYDOWN and event.key == pygame.K_EQUALS) or \
+            (event.type == pygame.MOUSEBUTTONDOWN and event.button == pygame.BUTTON_WHEELUP):
+            self.zoom_factor *= step
+            self.zoom_anchor = getattr(event, "pos", self.zoom_anchor)
+        elif (event.type == pygame.KEYDOWN and event.key == pygame.K_MINUS) or \
+            (event.type == pygame.MOUSEBUTTONDOWN and event.button == pygame.BUTTON_WHEELDOWN):
+            self.zoom_factor /= step
+            self.zoom_anchor = getattr(event, "pos", self.zoom_anchor)
+
+    # Apply this frame's pan, then zoom, to snip (only if already cropped).
+    def apply(self, snip):
+        if snip.state == State.CROPPED:
+            if self.mouse_pos != None and snip.window_state == State.PANNING:
+                snip.set_pan_offset(self.mouse_pos)
+            if self.zoom_factor != 1:
+                snip.increment_zoom(self.zoom_factor, self.zoom_anchor)
+        self.reset()
@@ -0,0 +1,94 @@
+import json
+import os
+
+import pygame
+
+CACHE_DIR = "cache"
+FONT_NAME = "Segoe UI"
+FONT_SIZE = 18
+FONT_BOLD = True
+COLOR_TEXT = (10, 10, 10)
+
+# Rendered button labels, cached between runs in one atlas image, plus resolved font file.
+# On a warm start no font is loaded at all (and no system font scan, which is slow where
+# Segoe UI is missing); the font is only resolved when a new label must be rendered.
+class LabelCache():
+    def __init__(self, name=FONT_NAME, size=FONT_SIZE, bold=FONT_BOLD, color=COLOR_TEXT, cache_dir=CACHE_DIR):
+        self.name = name
+        self.size = size
+        self.bold = bold
+        self.color = color
+        # Cache is only valid for same font and color.
+        self.key = "%s/%d/%s/%s" % (name, size, bold, color)
+        self.index_path = os.path.join(cache_dir, "labels.json")
+        self.atlas_path = os.path.join(cache_dir, "labels.png")
+        self.font = None
+        self.font_path = None
+        self.font_resolved = False
+        self.labels = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+            if index.get("key") != self.key:
+                return
+            self.font_path = index.get("font_path")
+            self.font_resolved = self.font_path == None or os.path.exists(self.font_path)
+            atlas = pygame.image.load(self.atlas_path)
+            self.labels = {text: atlas.subsurface(rect) for text, rect in index["labels"].items()}
+        except (OSError, ValueError, KeyError, pygame.error):
+            self.labels = {}
+
+    # Font file (None: pygame default font), found by system font scan only if not cached.
+    def get_font(self):
+        if self.font == None:
+            if not self.font_resolved:
+                self.font_path = pygame.font.match_font(self.name, bold=self.bold)
+                self.font_resolved = True
+            pygame.font.init()
+            self.font = pygame.font.Font(self.font_path, self.size)
+            if self.font_path == None:
+                # Same fallback as SysFont: default font, made bold.
+                self.font.set_bold(self.bold)
+        return self.font
+
+    def get_label(self, text):
+        if text not in self.labels:
+            # Blit on transparent surface so label keeps its transparency through saved PNG.
+            rendered = self.get_font().render(text, False, self.color)
+            label = pygame.Surface(rendered.get_size(), pygame.SRCALPHA)
+            label.blit(rendered, (0, 0))
+            self.labels[text] = label
+            self.save()
+        return self.labels[text]
+
+    # Pack labels in a row into atlas image, and write index (atomically, through temporary files).
+    def save(self):
+        width = sum(label.get_width() for label in self.labels.values())
+        height = max(label.get_height() for label in self.labels.values())
+        atlas = pygame.Surface((max(1, width), max(1, height)), pygame.SRCALPHA)
+        rects = {}
+        x = 0
+        for text, label in self.labels.items():
+            atlas.blit(label, (x, 0))
+            rects[text] = [x, 0, label.get_width(), label.get_height()]
+            x += label.get_width()
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            pygame.image.save(atlas, self.atlas_path + ".tmp.png")
+            os.replace(self.atlas_path + ".tmp.png", self.atlas_path)
+            with open(self.index_path + ".tmp", "w") as f:
+                json.dump({"key": self.key, "font_path": self.font_path, "labels": rects}, f)
+            os.replace(self.index_path + ".tmp", self.index_path)
+        except (OSError, pygame.error):
+            pass # cache is optional
+
+label_cache = None
+
+def get_label(text):
+    global label_cache
+    if label_cache == None:
+        label_cache = LabelCache()
+    return label_cache.get_label(text)
@@ -0,0 +1,158 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from PIL import Image
+from settings import get_settings
+from worker import get_worker
+
+# Longest side (px) of thumbnails.
+THUMBNAIL_SIZE = 160
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snips (
+    hash TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    left INTEGER,
+    upper INTEGER,
+    right INTEGER,
+    lower INTEGER
+);
+DROP INDEX IF EXISTS snips_created;
+CREATE INDEX IF NOT EXISTS snips_created_hash ON snips (created, hash);
+"""
+
+# Hash of pixels (and size, so same bytes at a different shape are a different snip).
+def get_hash(img):
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    digest = hashlib.sha256(("%dx%d:" % img.size).encode())
+    digest.update(img.tobytes())
+    return digest.hexdigest()
+
+# Write through a temporary file, so a crash never leaves a half written image.
+def save_atomic(img, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # per thread, in case two workers store the same new crop at once
+    temp = "%s.%d.tmp" % (path, threading.get_ident())
+    img.save(temp, "PNG")
+    os.replace(temp, path)
+
+# Persistent store of every crop, on disk under path.
+# Images are content addressed: objects/ab/abcd....png, named by pixel hash, so a duplicate
+# crop is never written twice. Each has a precomputed thumbnail under thumbnails/, so
+# listing never decodes full images. Metadata is kept in an SQLite index (index.sqlite)
+# with primary key lookup by hash and listing by creation time, both indexed.
+class Library():
+    def __init__(self, path="library"):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        # One connection shared by main loop and worker threads, serialized by lock.
+        self.connection = sqlite3.connect(os.path.join(path, "index.sqlite"), check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.executescript(SCHEMA)
+
+    def get_image_path(self, hash):
+        return os.path.join(self.path, "objects", hash[:2], hash + ".png")
+
+    def get_thumbnail_path(self, hash):
+        return os.path.join(self.path, "thumbnails", hash[:2], hash + ".png")
+
+    def contains(self, hash):
+        with self.lock:
+            row = self.connection.execute("SELECT 1 FROM snips WHERE hash = ?", (hash,)).fetchone()
+        return row != None
+
+    # Store crop (PIL image) taken from rectangle of capture, in background. Returns future of its hash.
+    def add(self, img, rectangle=None):
+        return get_worker().submit("library", self.store, img, dict(rectangle) if rectangle else None, time.time())
+
+    # Store crop now. Duplicate crops only update creation time, so they list as most recent.
+    def store(self, img, rectangle, created):
+        hash = get_hash(img)
+        if self.contains(hash):
+            with self.lock, self.connection:
+                self.connection.execute("UPDATE snips SET created = ? WHERE hash = ?", (created, hash))
+            return hash
+
+        save_atomic(img, self.get_image_path(hash))
+        thumbnail = img.convert("RGB") if img.mode not in ("RGB", "RGBA") else img.copy()
+        thumbnail.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.BOX)
+        save_atomic(thumbnail, self.get_thumbnail_path(hash))
+
+        rectangle = rectangle or {}
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO snips VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (hash, created, img.width, img.height, rectangle.get("left"), rectangle.get("upper"),
+                    rectangle.get("right"), rectangle.get("lower")))
+        return hash
+
+    # Metadata of snip, or None if not in library.
+    def get(self, hash):
+        with self.lock:
+            row = self.connection.execute("SELECT * FROM snips WHERE hash = ?", (hash,)).fetchone()
+        return self.to_entry(row) if row else None
+
+    # Up to limit snips, newest first (ties by hash), listed after entry after (None: from newest).
+    # Pass the last listed entry to get the next page; cost does not grow with library size.
+    # Paging on (created, hash) keeps snips stored at the same time (e.g. regions of one snip)
+    # from being skipped between pages.
+    def list(self, limit=100, after=None):
+        with self.lock:
+            if after == None:
+                rows = self.connection.execute("SELECT * FROM snips ORDER BY created DESC, hash DESC LIMIT ?", (limit,))
+            else:
+                rows = self.connection.execute("SELECT * FROM snips WHERE (created, hash) < (?, ?) "
+                                                "ORDER BY created DESC, hash DESC LIMIT ?",
+                                                (after["created"], after["hash"], limit))
+            rows = rows.fetchall()
+        return [self.to_entry(row) for row in rows]
+
+    def count(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM snips").fetchone()[0]
+
+    def to_entry(self, row):
+        hash, created, width, height, left, upper, right, lower = row
+        rectangle = None
+        if left != None:
+            rectangle = {"left": left, "upper": upper, "right": right, "lower": lower}
+        return {"hash": hash, "created": created, "size": (width, height), "rectangle": rectangle}
+
+    # Delete snip (image, thumbnail and metadata) from library. Returns whether it was in library.
+    def remove(self, hash):
+        with self.lock, self.connection:
+            removed = self.connection.execute("DELETE FROM snips WHERE hash = ?", (hash,)).rowcount > 0
+        for path in (self.get_image_path(hash), self.get_thumbnail_path(hash)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def get_thumbnail(self, hash):
+        return Image.open(self.get_thumbnail_path(hash))
+
+    def get_image(self, hash):
+        return Image.open(self.get_image_path(hash))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+library = None
+
+# Library at configured path, or None if saving to library is turned off.
+def get_library():
+    global library
+    settings = get_settings()
+    if not settings.library:
+        return None
+    if library == None:
+        library = Library(settings.library_path)
+    return library
@@ -1,23 +1,78 @@
-from snip import Snip, State
-from menu import Toolbar, NEW_SNIP
+import time
+# Process start, for startup time measurement.
+START_TIME = time.perf_counter()
+
+from snip import Snip, State, SCREEN_COLOR, get_memory_report
+from menu import Toolbar, MIN_WIDTH, NEW_SNIP, COPY_SNIP, EXPORT_SNIP, HISTORY_BACK, HISTORY_FORWARD
+from scheduler import RenderScheduler
+from worker import JOB_DONE, get_worker
+from settings import get_settings
+from history import SnipHistory
+import timing
+from inputs import InputCoalescer
+from capture import get_capture_source
+from library import get_library
 import pygame
 
-SCREEN_COLOR = (100, 100, 100)
-MIN_SCREEN_SIZE = (230,120)
+# Wide enough to show the whole toolbar.
+MIN_SCREEN_SIZE = (MIN_WIDTH,120)
+# Keys picking annotation tools.
+ANNOTATION_KEYS = {pygame.K_b: "blur", pygame.K_p: "pixelate", pygame.K_h: "highlight"}
+
+# Stop snip's recording, if running, before snip is replaced or Snippy quits,
+# so its recording thread does not keep grabbing the screen with no owner.
+def stop_recording(current_snip):
+    if current_snip != None and current_snip.state == State.RECORDING:
+        error = current_snip.stop_recording()
+        if error != None:
+            print("Could not record snip: %s" % error)
+
+# Leave snip before it is replaced or Snippy quits: stop its recording, and keep its crop in
+# library only now, with annotations made so far, so what was redacted is never written to disk.
+def leave_snip(current_snip):
+    stop_recording(current_snip)
+    if current_snip != None and current_snip.library_pending and get_library() != None:
+        # Each region on its own, in background.
+        for pic, rectangle in current_snip.get_regions():
+            get_library().add(pic, rectangle)
+        current_snip.library_pending = False
 
-def main():
+# first_frame_only: quit after first frame is shown (to measure startup time).
+def main(first_frame_only=False):
     running = True
+    # Initialize all modules, including timer used for button click visual and frame pacing.
+    pygame.init()
     WINDOW = pygame.display.set_mode(MIN_SCREEN_SIZE, pygame.RESIZABLE)
     pygame.display.set_caption("Snippy")
     ICON = pygame.image.load("icon.png").convert_alpha()
     pygame.display.set_icon(ICON)
 
+    if get_settings().timing:
+        timing.enable()
     toolbar = Toolbar()
     current_snip = None
+    history = SnipHistory(get_settings().history_budget_mb * 1024 * 1024)
+    scheduler = RenderScheduler()
+    coalescer = InputCoalescer()
+    # Start background capture now (if enabled), so first snip already has a frame.
+    capture_source = get_capture_source()
+    first_frame = True
+    # Time this frame's zoom was applied, until it is shown (None: no zoom waiting to be shown).
+    zoom_start = None
     while running:
-        WINDOW.fill(SCREEN_COLOR)
+        # Keep redrawing while selection, crop, pan, annotation box or zoom refinement is in progress; otherwise sleep until input.
+        scheduler.active = current_snip != None and \
+            (current_snip.state in (State.CROPPING, State.CROP) or current_snip.window_state == State.PANNING or
+                current_snip.annotation_start != None or
+                (current_snip.state == State.CROPPED and current_snip.zoom_view.refining()))
 
-        for event in pygame.event.get():
+        events = scheduler.get_events()
+        # Pick up settings file edited outside Snippy (cheap modified time check).
+        if get_settings().refresh():
+            toolbar.sync_settings()
+            scheduler.request_redraw()
+
+        for event in events:
             if current_snip != None:
                 # Get snipping coordinates.
                 if event.type == pygame.MOUSEBUTTONDOWN and event.button == pygame.BUTTON_LEFT:
@@ -26,58 +81,170 @@ def main():
                     if current_snip.state == State.SNIPPING:
                         current_snip.set_left_upper(pygame.mouse.get_pos())
                         current_snip.state = State.CROPPING
+                    # CROPPED: start annotation box, below toolbar
+                    elif current_snip.state == State.CROPPED and current_snip.tool != None and event.pos[1] > toolbar.height:
+                        current_snip.start_annotation(event.pos)
                 elif event.type == pygame.MOUSEBUTTONUP and event.button == pygame.BUTTON_LEFT:
                     # Mouse was released after pressed down
                     # SNIPPING: Get last corner of rectangle
                     if current_snip.state == State.CROPPING:
                         current_snip.set_right_lower(pygame.mouse.get_pos())
-                        current_snip.state = State.CROP
+                        # Shift held: keep rectangle and select another one from same capture.
+                        if pygame.key.get_mods() & pygame.KMOD_SHIFT:
+                            current_snip.add_region()
+                            scheduler.request_redraw(full=True)
+                        else:
+                            current_snip.state = State.CROP
+                    elif current_snip.annotation_start != None:
+                        current_snip.finish_annotation(event.pos)
+                        scheduler.request_redraw()
 
                 # Image view navigation.
                 if event.type == pygame.MOUSEBUTTONDOWN and event.button == pygame.BUTTON_MIDDLE:
                     # VIEWING CROPPED image: pan and track mouse change position if hold mouse wheel.
                     if current_snip.window_state != State.PANNING:
-                        current_snip.set_pivot(pygame.mouse.get_pos())
+                        current_snip.set_pivot(event.pos)
                         current_snip.window_state = State.PANNING
                 elif event.type == pygame.MOUSEBUTTONUP and event.button == pygame.BUTTON_MIDDLE:
                     # stop pan if release mouse wheel.
                     current_snip.window_state = State.IDLE
-                if current_snip.state == State.CROPPED:
-                    # VIEWING CROPPED image: set zoom in and out with mouse wheel.
-                    if (event.type == pygame.KEYDOWN and event.key == pygame.K_EQUALS) or \
-                        (event.type == pygame.MOUSEBUTTONDOWN and event.button == pygame.BUTTON_WHEELUP):
-                        current_snip.increment_zoom(1.5)
-                    elif (event.type == pygame.KEYDOWN and event.key == pygame.K_MINUS) or \
-                        (event.type == pygame.MOUSEBUTTONDOWN and event.button == pygame.BUTTON_WHEELDOWN):
-                        current_snip.increment_zoom(0.75)
+                # VIEWING CROPPED image: collect zoom and pan, applied once after all events.
+                coalescer.feed(event)
 
+            # Crop regions selected so far.
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_RETURN and current_snip != None and \
+                    current_snip.state == State.SNIPPING and current_snip.regions:
+                current_snip.state = State.CROP
             # Create snip and crop if new snip.
             if (event.type == pygame.KEYDOWN and event.key == pygame.K_1) or event.type == NEW_SNIP:
+                leave_snip(current_snip)
                 current_snip = Snip()
+                scheduler.request_redraw(full=True)
+            # Copy or export the crop held in memory.
+            if event.type == COPY_SNIP and current_snip != None and current_snip.state == State.CROPPED:
+                current_snip.save_to_clipboard()
+            if event.type == EXPORT_SNIP and current_snip != None and current_snip.state == State.CROPPED:
+                if current_snip.recording != None:
+                    # Last recording of this snip rather than still crop.
+                    format = get_settings().recording_format
+                    current_snip.export_recording("recording" if format.lower() == "frames" else "recording." + format.lower(), format)
+                else:
+                    current_snip.export("cropped." + get_settings().export_format.lower())
+            # Annotate crop: pick tool, or undo last annotation.
+            if event.type == pygame.KEYDOWN and event.key in ANNOTATION_KEYS and current_snip != None and current_snip.state == State.CROPPED:
+                current_snip.set_tool(ANNOTATION_KEYS[event.key])
+                pygame.display.set_caption("Snippy" if current_snip.tool == None else "Snippy - " + current_snip.tool)
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_z and event.mod & pygame.KMOD_CTRL and current_snip != None:
+                current_snip.undo_annotation()
+                scheduler.request_redraw()
+            # Turn snapping selection to edges on or off.
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_s:
+                get_settings().set("snap_edges", not get_settings().snap_edges)
+                if current_snip != None:
+                    current_snip.prepare_snapping()
+            # Start or stop recording crop rectangle of screen.
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_r and current_snip != None:
+                if current_snip.state == State.RECORDING:
+                    stop_recording(current_snip)
+                    scheduler.request_redraw(full=True)
+                elif current_snip.can_record():
+                    current_snip.start_recording()
+                    scheduler.request_redraw(full=True)
+            # Step through snip history, without re-decoding any file.
+            if (event.type == pygame.KEYDOWN and event.key == pygame.K_LEFT) or event.type == HISTORY_BACK:
+                direction = -1
+            elif (event.type == pygame.KEYDOWN and event.key == pygame.K_RIGHT) or event.type == HISTORY_FORWARD:
+                direction = 1
+            else:
+                direction = 0
+            if direction != 0:
+                entry = history.step(direction)
+                if entry != None:
+                    leave_snip(current_snip)
+                    current_snip = Snip(entry.get_image())
+                    current_snip.history_entry = entry
+                    scheduler.request_redraw(full=True)
+            if event.type == JOB_DONE and event.job == "history":
+                history.trim()
+            if event.type == JOB_DONE and event.error != None:
+                print("Could not %s snip: %s" % (event.job, event.error))
             # Check which buttons on toolbar are pressed.
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == pygame.BUTTON_LEFT:
                 toolbar.update(WINDOW, True)
                 
+            # Print pixel memory held by each snip.
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F8:
+                print("\n".join(get_memory_report()))
+            # Write stage timing percentiles.
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F9 and timing.enabled:
+                timing.dump()
+
             # Quit window if press ESC or exit.
             if event.type == pygame.QUIT:
                 running = False
+                leave_snip(current_snip)
+                get_worker().shutdown()
+                capture_source.close()
+                if timing.enabled:
+                    timing.dump()
                 pygame.quit()
                 return
             if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
                 running = False
+                leave_snip(current_snip)
+                get_worker().shutdown()
+                capture_source.close()
+                if timing.enabled:
+                    timing.dump()
                 pygame.quit()
                 return
 
+        if current_snip != None:
+            if coalescer.zoom_factor != 1 and current_snip.state == State.CROPPED and zoom_start == None:
+                zoom_start = time.perf_counter()
+            coalescer.apply(current_snip)
+        coalescer.reset()
+
+        if not scheduler.should_draw():
+            continue
+        # Snipping layers redraw only what changed; otherwise redraw whole window.
+        full = scheduler.full or current_snip == None or not current_snip.can_redraw_partial()
+        if full:
+            WINDOW.fill(SCREEN_COLOR)
+
         # Only display toolbar if not snipping screenshot.
+        dirty_rects = None
         if current_snip != None:
-            current_snip.update(WINDOW)
+            dirty_rects = current_snip.update(WINDOW, full)
+            # Keep new crops in history.
+            if current_snip.state == State.CROPPED and current_snip.history_entry == None:
+                current_snip.history_entry = history.add(current_snip.get_pic())
             if current_snip.state == State.SNIPPING or current_snip.state == State.CROPPING:
                 toolbar.visible = False
             else:
                 toolbar.visible = True
 
         toolbar.update(WINDOW, False)
-        pygame.display.update()
+        if dirty_rects == None:
+            pygame.display.update()
+        else:
+            pygame.display.update(dirty_rects)
+        scheduler.drawn()
+        if zoom_start != None:
+            # Time from zoom step to zoomed image shown.
+            timing.record("zoom", time.perf_counter() - zoom_start)
+            zoom_start = None
+        if first_frame:
+            # Time from process start to first frame shown.
+            first_frame = False
+            startup = time.perf_counter() - START_TIME
+            timing.record("startup", startup)
+            if first_frame_only:
+                print("startup_ms %.1f" % (startup * 1000))
+                pygame.quit()
+                return
+        # Wake up to end button click visual.
+        scheduler.wake_at(toolbar.next_redraw())
 
 
 if __name__ == "__main__":
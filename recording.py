@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+from collections import deque
+
+import numpy
+from PIL import Image
+from timing import stage
+
+# Side (px) of square tiles frames are compared and stored in.
+TILE_SIZE = 32
+
+# Frames of a screen region, kept as one base frame and per frame deltas of changed tiles.
+# Frames are compared tile by tile in one vectorized pass; unchanged tiles are not stored.
+# Held memory is kept within budget bytes by folding oldest deltas into the base frame,
+# so a long recording keeps its most recent part.
+class Recording():
+    def __init__(self, size, budget=64 * 1024 * 1024, tile=TILE_SIZE):
+        self.size = size
+        self.budget = budget
+        self.tile = tile
+        # Frame size padded to whole tiles.
+        self.tiles_x = -(-size[0] // tile)
+        self.tiles_y = -(-size[1] // tile)
+        self.shape = (self.tiles_y * tile, self.tiles_x * tile, 3)
+        # Oldest kept frame, and (changed tile mask, changed tiles, time) of each later frame.
+        self.base = None
+        self.base_time = None
+        self.deltas = deque()
+        # Latest frame, compared against next one.
+        self.last = None
+        self.delta_bytes = 0
+        self.dropped = 0
+
+    # Tiles of padded frame as a (tiles_y, tiles_x, tile, tile, 3) view (writes go through to frame).
+    def get_tiles(self, frame):
+        tile = self.tile
+        return frame.reshape(self.tiles_y, tile, self.tiles_x, tile, 3).swapaxes(1, 2)
+
+    def to_array(self, img):
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        frame = numpy.zeros(self.shape, numpy.uint8)
+        frame[:img.height, :img.width] = numpy.asarray(img)
+        return frame
+
+    # Add frame (PIL image of region) grabbed at time taken (seconds).
+    def add(self, img, taken):
+        frame = self.to_array(img)
+        if self.last is None:
+            self.base = frame
+            self.base_time = taken
+            self.last = frame.copy()
+            return
+        tiles = self.get_tiles(frame)
+        changed = (tiles != self.get_tiles(self.last)).any(axis=(2, 3, 4))
+        delta = (changed, tiles[changed], taken)
+        self.deltas.append(delta)
+        self.delta_bytes += changed.nbytes + delta[1].nbytes
+        self.last = frame
+        self.trim()
+
+    def get_bytes(self):
+        return self.delta_bytes + (2 * self.base.nbytes if self.base is not None else 0)
+
+    # Drop oldest frames (apply their deltas to base) until within budget.
+    def trim(self):
+        while self.get_bytes() > self.budget and self.deltas:
+            changed, tiles, taken = self.deltas.popleft()
+            self.get_tiles(self.base)[changed] = tiles
+            self.base_time = taken
+            self.delta_bytes -= changed.nbytes + tiles.nbytes
+            self.dropped += 1
+
+    def get_frame_count(self):
+        return 0 if self.base is None else len(self.deltas) + 1
+
+    # Kept frames, oldest first, as (PIL image, time).
+    def frames(self):
+        if self.base is None:
+            return
+        frame = self.base.copy()
+        yield self.to_image(frame), self.base_time
+        tiles = self.get_tiles(frame)
+        for changed, changed_tiles, taken in self.deltas:
+            tiles[changed] = changed_tiles
+            yield self.to_image(frame), taken
+
+    # Image of padded frame (a copy; frame is updated in place for the next frame).
+    def to_image(self, frame):
+        width, height = self.size
+        return Image.frombytes("RGB", self.size, frame[:height, :width].tobytes())
+
+    # Write kept frames as an animated image (GIF, PNG, WEBP), or, if format is "frames",
+    # as numbered PNG files in directory path.
+    def export(self, path, format):
+        if self.base is None:
+            return
+        if format.lower() == "frames":
+            os.makedirs(path, exist_ok=True)
+            for number, (img, _) in enumerate(self.frames()):
+                img.save(os.path.join(path, "frame_%05d.png" % number))
+            return
+        # Each frame is shown until the next one was taken.
+        times = [taken for _, _, taken in self.deltas]
+        durations = [round((end - start) * 1000) for start, end in zip([self.base_time] + times, times)]
+        durations.append(durations[-1] if durations else 100)
+        frames = (img for img, _ in self.frames())
+        first = next(frames)
+        first.save(path, format, save_all=True, append_images=frames, duration=durations, loop=0)
+
+# Grabs bbox of source into a Recording at fps frames per second, in a background thread.
+# Frames run on a fixed schedule; if a grab overruns, late frames are skipped, never queued.
+class Recorder():
+    def __init__(self, source, bbox, fps=10, budget=64 * 1024 * 1024):
+        self.source = source
+        self.bbox = bbox
+        self.interval = 1 / fps
+        self.recording = Recording((bbox[2] - bbox[0], bbox[3] - bbox[1]), budget)
+        self.skipped = 0
+        self.error = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="snippy-record", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        next_time = time.monotonic()
+        while not self.stopped.is_set():
+            try:
+                with stage("record_frame"):
+                    self.recording.add(self.source.grab(self.bbox), time.monotonic())
+            except Exception as error:
+                # Recording ends here; error is reported by stop.
+                self.error = error
+                return
+            next_time += self.interval
+            now = time.monotonic()
+            if now > next_time:
+                # Behind schedule: skip missed frames instead of catching up.
+                missed = int((now - next_time) / self.interval) + 1
+                self.skipped += missed
+                next_time += missed * self.interval
+            self.stopped.wait(next_time - now)
+
+    # Stop recording. Returns the Recording.
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        return self.recording
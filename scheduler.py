@@ -0,0 +1,58 @@
+import pygame
+
+# Frame rate cap while something is moving (dragging a selection, panning).
+ACTIVE_FPS = 60
+# Events after which whole window must be redrawn (window contents lost or resized).
+FULL_REDRAW_EVENTS = (pygame.VIDEORESIZE, pygame.VIDEOEXPOSE, pygame.WINDOWSIZECHANGED,
+                        pygame.WINDOWEXPOSED, pygame.WINDOWSHOWN, pygame.WINDOWRESTORED)
+
+# Decides when main loop should wait for events and when it should redraw.
+# Idle: block until an event arrives (or a requested wake up time passes), so no CPU is used.
+# Active: poll events and redraw every frame, capped at fps.
+class RenderScheduler():
+    def __init__(self, fps=ACTIVE_FPS):
+        self.clock = pygame.time.Clock()
+        self.fps = fps
+        self.active = False
+        self.dirty = True
+        self.full = True
+        self.wake_time = None
+
+    # Redraw on next frame.
+    def request_redraw(self, full=False):
+        self.dirty = True
+        self.full = self.full or full
+
+    # Redraw once at ticks (ms since pygame.init), e.g. to end a button's click visual.
+    def wake_at(self, ticks):
+        if ticks is not None and (self.wake_time is None or ticks < self.wake_time):
+            self.wake_time = ticks
+
+    def get_events(self):
+        if self.active or self.dirty:
+            self.clock.tick(self.fps)
+            events = pygame.event.get()
+        else:
+            # Nothing to draw: sleep until next event, or wake up time.
+            timeout = 0 # wait forever
+            if self.wake_time is not None:
+                timeout = max(1, self.wake_time - pygame.time.get_ticks())
+            event = pygame.event.wait(timeout)
+            events = [] if event.type == pygame.NOEVENT else [event] + pygame.event.get()
+
+        # Any input (mouse, keys, window resize) may change what is shown.
+        if events:
+            self.dirty = True
+        if any(event.type in FULL_REDRAW_EVENTS for event in events):
+            self.full = True
+        if self.wake_time is not None and pygame.time.get_ticks() >= self.wake_time:
+            self.wake_time = None
+            self.dirty = True
+        return events
+
+    def should_draw(self):
+        return self.dirty or self.active
+
+    def drawn(self):
+        self.dirty = False
+        self.full = False
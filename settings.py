@@ -0,0 +1,96 @@
+import os
+import time
+
+SETTINGS_FILE = "settings.txt"
+
+# Setting name and default value. Values read from file are converted to type of default.
+DEFAULTS = {
+    "auto_copy": False,         # copy snip to clipboard as soon as it is cropped
+    "export_format": "PNG",     # file format for Export
+    "zoom_step": 1.5,           # zoom factor per wheel step
+    "worker_count": 2,          # background threads for encoding, export and clipboard
+    "memory_budget_mb": 256,    # pixel memory for zoomed tiles
+    "history_budget_mb": 64,    # compressed snips kept in snip history
+    "prewarm_capture": False,   # keep a recent screen frame ready in background, so New Snip is instant
+    "prewarm_interval_ms": 500, # how often background frame is refreshed
+    "snap_edges": False,        # snap selection corners to nearby window and widget edges
+    "recording_fps": 10,        # frames per second when recording a region
+    "recording_budget_mb": 64,  # recorded frames kept in memory; oldest are dropped past this
+    "recording_format": "GIF",  # GIF, PNG or WEBP animation, or "frames" for a folder of PNG files
+    "library": False,           # keep every crop in the snip library on disk
+    "library_path": "library",  # folder of snip library
+    "timing": False,            # record stage timings, written to timing.txt on exit or F9
+}
+
+# Preferences held in memory. Loaded once, written back atomically, and reloaded only
+# when the file's modified time changes (checked at most every check_interval seconds).
+class Settings():
+    def __init__(self, path=SETTINGS_FILE, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.last_check = 0
+        self.mtime = None
+        for name, value in DEFAULTS.items():
+            setattr(self, name, value)
+        self.load()
+
+    def parse(self, name, text):
+        default = DEFAULTS[name]
+        if isinstance(default, bool):
+            return text.strip().lower() == "true"
+        return type(default)(text.strip())
+
+    def load(self):
+        try:
+            self.mtime = os.stat(self.path).st_mtime
+            with open(self.path, "r") as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return
+        # Old settings file is a single AutoCopy boolean.
+        if len(lines) == 1 and "=" not in lines[0]:
+            lines = ["auto_copy = " + lines[0]]
+        for line in lines:
+            name, _, text = line.partition("=")
+            name = name.strip()
+            if name in DEFAULTS:
+                try:
+                    setattr(self, name, self.parse(name, text))
+                except ValueError:
+                    pass # keep previous value
+
+    # Reload if file was edited outside Snippy. Returns whether settings changed.
+    def refresh(self):
+        now = time.monotonic()
+        if now - self.last_check < self.check_interval:
+            return False
+        self.last_check = now
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return False
+        if mtime == self.mtime:
+            return False
+        self.load()
+        return True
+
+    # Write to temporary file then replace, so file is never half written.
+    def save(self):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            for name in DEFAULTS:
+                f.write("%s = %s\n" % (name, getattr(self, name)))
+        os.replace(temp_path, self.path)
+        self.mtime = os.stat(self.path).st_mtime
+
+    def set(self, name, value):
+        setattr(self, name, value)
+        self.save()
+
+settings = None
+
+def get_settings():
+    global settings
+    if settings == None:
+        settings = Settings()
+    return settings
@@ -1,26 +1,39 @@
 import os
-from menu import read_setting
+import weakref
+from settings import get_settings
 
-from PIL import ImageGrab
+from PIL import Image
 import pygame
 from pygame.constants import KEYDOWN, K_1, K_ESCAPE
-import ctypes
-from ctypes import wintypes 
 from enum import Enum
+from zoom import ZoomView, MIN_ZOOM, MAX_ZOOM, get_surface_bytes
 
 import math
-# for clipboard saving
-import win32clipboard as clip
-import win32con
-from io import BytesIO
+from clipboard import encode_dib, get_clipboard
+from worker import get_worker
+from timing import stage
+from capture import get_capture_source, get_direct_source
+from recording import Recorder
+from menu import MIN_WIDTH
 
 OFFSET_CENTER = (50, 50)
+SCREEN_COLOR = (100, 100, 100)
+SNIP_WINDOW_SIZE = (700, 600)
+# Space (px) between crops of a multi-region snip, shown side by side.
+REGION_GAP = 10
+OVERLAY_COLOR = (220, 220, 220)
+RECT_COLOR = (220, 100, 150)
+RECORD_COLOR = (220, 40, 40)
+# Distance (window px) within which selection corners snap to edges.
+SNAP_RADIUS = 8
 
 class State(Enum):
     SNIPPING = 1
     CROPPING = 2
     CROP = 3
     CROPPED = 4
+    # Recording frames of crop rectangle (after CROPPED)
+    RECORDING = 8
 
     # Window states
     # (NOTE: will only pan cropped image)
@@ -28,44 +41,88 @@ class State(Enum):
     PANNING = 6
     ZOOMING = 7
 
-# Get window position offset (on real screen) for when cropping.
-# Get window position: https://python-forum.io/Thread-pygame-get-window-position http://www.akeric.com/blog/?page_id=814
-# api docs: https://docs.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getwindowrect
-class Window_Info():
-    def __init__(self):
-        # pygame tracks the window handler, and makes it available
-        self.window_handler = pygame.display.get_wm_info()["window"]
-        # build a GetWindowRect
-        self.get_window_rect = self.build_win_info_function()
-    
-    def build_win_info_function(self):
-        builder = ctypes.WINFUNCTYPE(wintypes.BOOL, wintypes.HWND, ctypes.POINTER(wintypes.RECT))
-    
-        # 1==we're passing this in, 2==ctypes is passing it back to us
-        flags = ((1, "hwnd"), (2, "lprect"))
-    
-        # now that we've described the function, we indicate where it exists so we can call it
-        func = builder(("GetWindowRect", ctypes.windll.user32), flags)
-        return func
-
-    def get_window_position(self):
-        position = {"upper": 0, "left": 0, "right": 0, "lower": 0}
-        # get the current window info
-        window_info = self.get_window_rect(self.window_handler)
-        position["upper"] = window_info.top
-        position["left"] = window_info.left
-        position["right"] = window_info.right
-        position["lower"] = window_info.bottom
-        return position
-
+# Timing stage for drawing a frame in each state.
+FRAME_STAGES = {State.SNIPPING: "frame_snipping", State.CROPPING: "frame_cropping",
+                State.CROP: "crop_to_display", State.CROPPED: "frame_cropped", State.RECORDING: "frame_recording"}
+
+# Crop box (left, upper, right, lower) for a crop rectangle with corners in order (see Snip.set_corners).
+# Rectangle of size 0 crops single pixel.
+def get_crop_box(rectangle):
+    if rectangle["left"] == rectangle["right"] or rectangle["upper"] == rectangle["lower"]:
+        return (0, 0, 1, 1)
+    return (rectangle["left"], rectangle["upper"], rectangle["right"], rectangle["lower"])
+
+# Maps between snipping window (preview) and full resolution capture coordinates.
+# Capture is scaled down to fit window (never up) and centered in it.
+class PreviewTransform():
+    def __init__(self, capture_size, window_size):
+        self.capture_size = capture_size
+        self.window_size = window_size
+        scale = min(1, window_size[0] / capture_size[0], window_size[1] / capture_size[1])
+        self.size = (max(1, round(capture_size[0] * scale)), max(1, round(capture_size[1] * scale)))
+        self.offset = ((window_size[0] - self.size[0]) // 2, (window_size[1] - self.size[1]) // 2)
+        # Exact ratio per axis, after rounding preview size.
+        self.scale_x = capture_size[0] / self.size[0]
+        self.scale_y = capture_size[1] / self.size[1]
+
+    # Window point to capture pixel, clamped to capture.
+    def to_capture(self, point):
+        x = round((point[0] - self.offset[0]) * self.scale_x)
+        y = round((point[1] - self.offset[1]) * self.scale_y)
+        return (min(max(x, 0), self.capture_size[0]), min(max(y, 0), self.capture_size[1]))
+
+    def to_preview(self, point):
+        return (round(point[0] / self.scale_x) + self.offset[0], round(point[1] / self.scale_y) + self.offset[1])
+
+# Snips still in memory (a snip leaves once nothing refers to it), for memory reports.
+live_snips = weakref.WeakSet()
+
+# Pixel bytes held by each snip still in memory, one line per snip.
+def get_memory_report():
+    lines = []
+    for snip in live_snips:
+        memory = snip.get_memory()
+        parts = ", ".join("%s %.1f MB" % (name, size / 1024 / 1024) for name, size in memory.items() if size > 0)
+        lines.append("snip %s %s: %.1f MB (%s)" % (hex(id(snip)), snip.state.name, sum(memory.values()) / 1024 / 1024, parts))
+    return lines
+
+# Pixel bytes of PIL image.
+def get_image_bytes(img):
+    return img.width * img.height * len(img.getbands())
 
 class Snip:
-    def __init__(self):
+    # New snip grabs screen from source (default: configured capture source).
+    # If cropped (PIL image) is given, e.g. from history, show it as an already cropped snip.
+    def __init__(self, cropped=None, source=None):
         self.state = State.SNIPPING
         self.crop_rectangle = {"left": 0, "upper": 0, "right": 0, "lower": 0}
-        self.window_info = Window_Info()
-        #self.prev_window_pos = self.window_info.get_window_position()
-        self.grab_screen()
+        # Entry of this snip in snip history, once added.
+        self.history_entry = None
+        # Whether crop, as annotated so far, is yet to be kept in library.
+        self.library_pending = False
+        # Screen region recording, while recording and once stopped.
+        self.recorder = None
+        self.recording = None
+        # Full resolution capture, held only until cropped.
+        self.screenshot = None
+        # Crop rectangles added so far in multi-region mode, and where each crop is on the
+        # side by side image once cropped (None if snip has a single crop).
+        self.regions = []
+        self.region_boxes = None
+        self.source = source or get_capture_source()
+        # Whether snip is cropped from a screen capture (not opened from history).
+        self.captured = cropped == None
+        # Edge index of capture (future), for snapping selection to edges.
+        self.edge_index = None
+        # Annotation tool in use, and crop point where current annotation drag started.
+        self.tool = None
+        self.annotation_start = None
+        if cropped == None:
+            self.grab_screen(self.source)
+        else:
+            self.set_cropped(cropped, self.load(cropped))
+            self.state = State.CROPPED
+            self.fit_window()
 
         self.window_state = State.IDLE
         self.pan_offset = (0, 0)
@@ -73,20 +130,33 @@ class Snip:
         self.pivot = (0, 0)
         #self.previous_zoom_pos = (0, 0)
 
+        # What was last drawn to the window, so snipping frames can redraw only what changed.
+        self.drawn_state = None
+        self.drawn_rect = None
+        live_snips.add(self)
+
+    # Convert PIL image to 24-bit pygame surface straight from its pixel buffer (no disk round trip).
+    # Screen captures have no transparency, so no alpha channel is kept.
     def load(self, img):
-        return pygame.image.load(img).convert_alpha()
- 
-    def grab_screen(self):
-        # minimize screen to "hide" it
-        pygame.display.set_mode((1,1), pygame.NOFRAME)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        return pygame.image.frombytes(img.tobytes(), img.size, "RGB")
+
+    def grab_screen(self, source):
+        # minimize screen to "hide" it, if source grabs screen now
+        if source.live:
+            pygame.display.set_mode((1,1), pygame.NOFRAME)
 
         # grab screen shot of entire screen
-        screenshot = ImageGrab.grab()
-        screenshot.save('screen_shot.png', 'PNG') 
-        self.screenshot_img = self.load("screen_shot.png")
+        # keep capture in memory; crops are sliced from it later.
+        with stage("grab"):
+            self.screenshot = source.grab()
 
         # return to unminimized screen
-        pygame.display.set_mode((700,600), pygame.RESIZABLE)
+        pygame.display.set_mode(SNIP_WINDOW_SIZE, pygame.RESIZABLE)
+        with stage("layers"):
+            self.build_layers(SNIP_WINDOW_SIZE)
+        self.prepare_snapping()
         # For now, cannot use fullscreen due to bug https://github.com/pygame/pygame/issues/2360 
         # Get full screen size of user
         # user32 = ctypes.windll.user32
@@ -96,38 +166,142 @@ class Snip:
         # pygame.display.set_mode((width - 100, height - 100), pygame.RESIZABLE)
         #pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
 
+    # Precomposite window sized layers once per capture (and window resize), instead of every frame:
+    # preview of capture scaled down to fit window, and same preview dimmed.
+    # Full resolution capture is never converted to a surface, only the preview.
+    def build_layers(self, window_size):
+        self.preview = PreviewTransform(self.screenshot.size, window_size)
+        # Box filter reduction runs over whole image in C.
+        preview = self.screenshot.resize(self.preview.size, Image.BOX)
+        self.preview_img = pygame.Surface(window_size).convert()
+        self.preview_img.fill(SCREEN_COLOR)
+        self.preview_img.blit(self.load(preview), self.preview.offset)
+
+        overlay = pygame.Surface(window_size)
+        overlay.set_alpha(50)
+        overlay.fill(OVERLAY_COLOR)
+        self.snip_layer = self.preview_img.copy()
+        self.snip_layer.blit(overlay, (0, 0))
+        for region in self.regions:
+            self.draw_region(region)
+
+    # Outline added region on both snipping layers, so it is kept by partial redraws.
+    def draw_region(self, region):
+        left, upper = self.preview.to_preview((region["left"], region["upper"]))
+        right, lower = self.preview.to_preview((region["right"], region["lower"]))
+        rect = pygame.Rect(left, upper, right - left, lower - upper)
+        self.draw_rect(self.preview_img, rect)
+        self.draw_rect(self.snip_layer, rect)
+
+    # Keep selected rectangle as one of several regions cut from this capture, and select next one.
+    def add_region(self):
+        if self.set_corners():
+            region = dict(self.crop_rectangle)
+            self.regions.append(region)
+            self.draw_region(region)
+        self.crop_rectangle = {"left": 0, "upper": 0, "right": 0, "lower": 0}
+        self.state = State.SNIPPING
+
+    # Build edge index of capture in background if snapping is on, so the first frame is not delayed.
+    # Until it is ready, corners are not snapped.
+    def prepare_snapping(self):
+        if get_settings().snap_edges and self.edge_index == None and self.state in (State.SNIPPING, State.CROPPING):
+            from edges import EdgeIndex # edge detection only loaded if snapping is used
+            self.edge_index = get_worker().submit("edges", EdgeIndex, self.screenshot)
+
+    # Window point to capture pixel, snapped to nearest strong edges if snapping is on and index is ready.
+    def to_capture(self, point):
+        point = self.preview.to_capture(point)
+        index = self.edge_index
+        if get_settings().snap_edges and index != None and index.done() and index.exception() == None:
+            radius = max(1, round(SNAP_RADIUS * max(self.preview.scale_x, self.preview.scale_y)))
+            point = index.result().snap(point, radius)
+        return point
+
     # SNIPPING before mouseDown
     # display screen
-    def snip(self, screen):
-        # set screen shot
-        screen.blit(self.screenshot_img, (0, 0))
-
-        # draw overlay
-        overlay_color = (220, 220, 220)
-        overlay = pygame.Surface((pygame.display.get_surface().get_width(), pygame.display.get_surface().get_height()))
-        overlay.set_alpha(50)
-        overlay.fill(overlay_color)
-        screen.blit(overlay, (0,0))
+    def snip(self, screen, full):
+        # dimmed screen shot does not change until mouseDown
+        if full:
+            screen.blit(self.snip_layer, (0, 0))
+            return None
+        return []
 
     # CROPPING after mouseDown, before mouseUp
     # Crop on top of screen AND draw rectangle
-    def cropping(self, screen):
-        screen.blit(self.screenshot_img, (0, 0))
-
-        # draw rectangle
-        self.draw_rect(screen)
+    def cropping(self, screen, full):
+        # Show corner where it will snap to.
+        rect = self.get_selection(self.preview.to_preview(self.to_capture(pygame.mouse.get_pos())))
+        if full:
+            screen.blit(self.preview_img, (0, 0))
+            self.draw_rect(screen, rect)
+            self.drawn_rect = rect
+            return None
+        if rect == self.drawn_rect:
+            return []
+
+        # Only erase old rectangle edges and draw new ones.
+        dirty = self.get_edges(self.drawn_rect) + self.get_edges(rect)
+        for edge in self.get_edges(self.drawn_rect):
+            screen.blit(self.preview_img, edge, edge)
+        self.draw_rect(screen, rect)
+        self.drawn_rect = rect
+        return dirty
+
+    # One pixel wide edges of rectangle outline.
+    def get_edges(self, rect):
+        width = max(rect.width, 1)
+        height = max(rect.height, 1)
+        return [pygame.Rect(rect.left, rect.top, width, 1),
+                pygame.Rect(rect.left, rect.top + height - 1, width, 1),
+                pygame.Rect(rect.left, rect.top, 1, height),
+                pygame.Rect(rect.left + width - 1, rect.top, 1, height)]
 
     # CROP if mouseUp
     # save crop
     def crop(self, screen):
         # on mouseUp, change to CROPPED state and save crop
-        self.crop_pic(screen, "cropped.png")
+        with stage("crop"):
+            self.crop_pic()
+        self.library_pending = True
+        self.release_capture()
         self.state = State.CROPPED
         self.cropped(screen)
-
-        # change window size to crop size and padding, but at least minimum size
+        self.fit_window()
+
+    # Once cropped, full capture and window sized snipping layers are no longer needed.
+    def release_capture(self):
+        self.screenshot = None
+        self.preview_img = None
+        self.snip_layer = None
+        # Edges are only needed while selecting.
+        self.edge_index = None
+
+    # Pixel bytes held by this snip, by what holds them.
+    def get_memory(self):
+        memory = {"capture": 0, "layers": 0, "edges": 0, "crop": 0, "zoom": 0, "annotations": 0, "recording": 0}
+        if self.screenshot != None:
+            memory["capture"] = get_image_bytes(self.screenshot)
+            memory["layers"] = get_surface_bytes(self.preview_img) + get_surface_bytes(self.snip_layer)
+        if self.edge_index != None and self.edge_index.done() and self.edge_index.exception() == None:
+            edges = self.edge_index.result()
+            memory["edges"] = edges.vertical.nbytes + edges.horizontal.nbytes
+        if self.state in (State.CROPPED, State.RECORDING):
+            memory["crop"] = get_surface_bytes(self.cropped_img)
+            if self.cropped_pic != None:
+                memory["crop"] += get_image_bytes(self.cropped_pic)
+            memory["zoom"] = self.zoom_view.get_bytes()
+            if self.annotator != None:
+                memory["annotations"] = self.annotator.get_bytes()
+        recording = self.recorder.recording if self.recorder != None else self.recording
+        if recording != None:
+            memory["recording"] = recording.get_bytes()
+        return memory
+
+    # change window size to crop size and padding, but at least minimum size
+    def fit_window(self):
         image = self.cropped_img.get_rect()
-        width = max(image.width + 100, 225)
+        width = max(image.width + 100, MIN_WIDTH)
 
         # reposition to previous position - workaround to fullscreen bug setting window outside screen https://github.com/pygame/pygame/issues/2360 
         # pygame.display.quit()
@@ -140,135 +314,205 @@ class Snip:
     # self.state == State.CROPPED after mouseUp
     # display crop
     def cropped(self, screen):
-        #image = self.cropped_img
-
-        # Clamp maximum zoom at 150 to prevent memory error (note: smaller image = can zoom in more, bigger = zoom in less)
-        # small images max: 150-200. medium/big image max: 57
-        # TODO: maybe scale only a small portion of original image that will be visible -> disregard rest (calculate and crop)
-
-        # Workaround is use pillow to resize an image file in separate name, and only resize by factor of resize image, not original
-        # CON: if big zoom, may still be scaling large image -- not necessarily work, could even be slower
-        # https://opensource.com/life/15/2/resize-images-python
-        # https://stackoverflow.com/questions/4373141/dealing-with-huge-potentially-over-30000x30000-images-in-python
-
-        # Maybe: get width and height, clamp to max. (prevent scaling too large image)
-        
-        #scale_image = pygame.transform.scale(image, (img_width, img_height))  # NOTE: may want to separately save transformed image and recale only on zoom,
-        # not every frame so not as resource intensive.
-        screen.blit(self.cropped_zoomed_img, (self.pan_offset[0] + OFFSET_CENTER[0], self.pan_offset[1] + OFFSET_CENTER[1]))
+        # Only tiles inside the window are scaled and drawn.
+        self.zoom_view.draw(screen, (self.pan_offset[0] + OFFSET_CENTER[0], self.pan_offset[1] + OFFSET_CENTER[1]), self.zoom_scale)
+        # Box being annotated.
+        if self.annotation_start != None:
+            left, upper = self.to_window(self.annotation_start)
+            x, y = pygame.mouse.get_pos()
+            self.draw_rect(screen, pygame.Rect(min(left, x), min(upper, y), abs(x - left), abs(y - upper)))
 
         #TODO: Also display cropped image size in px, on window.
 
-    def set_pan_offset(self):
-        # pan only if already cropped
-        offset_x = pygame.mouse.get_pos()[0] - self.pivot[0] 
-        offset_y = pygame.mouse.get_pos()[1] - self.pivot[1]
+    # pan so pivot follows point (mouse)
+    def set_pan_offset(self, point):
+        offset_x = point[0] - self.pivot[0]
+        offset_y = point[1] - self.pivot[1]
         self.pan_offset = (offset_x, offset_y)
 
-    def increment_zoom(self, factor):
-        # temporary fix to not being able to scale too much - out of memory issue.
-        img_width = self.cropped_img.get_width()*self.zoom_scale
-        img_height = self.cropped_img.get_height()*self.zoom_scale
-        #print(img_width, img_height)
-
-        if factor > 1 and (img_height > 4000 or img_width > 4000):
-            return False # cannot zoom in more, or overflow
-        # otherwise, zoom in more, or zoom out
-        self.zoom_scale *= factor
-
-        img_width = int(self.cropped_img.get_width()*self.zoom_scale)
-        img_height = int(self.cropped_img.get_height()*self.zoom_scale)
-        self.cropped_zoomed_img = pygame.transform.scale(self.cropped_img, (img_width, img_height)) 
-
-        # To zoom relative to mouse and NOT topleft corner of image
-        #print(self.cropped_img.get_rect().center) # doesn't work since we blit a copy of image, not image itself
-        #self.pan_offset = (self.pan_offset[0]-pygame.mouse.get_pos()[0], self.pan_offset[1]-pygame.mouse.get_pos()[1])
-
-        # GOAL: get mouse position on image itself
-        # subtract mouse position relative to image topleft in game.
-        # Image position (topleft): (self.pan_offset[0] + OFFSET_CENTER[0], self.pan_offset[1] + OFFSET_CENTER[1])
-        # img.get_Width and get_height * zoom_scale <- factor?
-
-        # Mouse position over image. https://stackoverflow.com/questions/53085568/how-do-i-get-the-mouse-position-on-a-pygame-scaled-surface
-        # print((pygame.mouse.get_pos()[0] - self.pan_offset[0] - OFFSET_CENTER[0]) / self.zoom_scale,
-        #         (pygame.mouse.get_pos()[1] - self.pan_offset[1] - OFFSET_CENTER[1])  / self.zoom_scale)
-
-        # current_zoom_pos = ((pygame.mouse.get_pos()[0] - self.pan_offset[0] - OFFSET_CENTER[0]) / self.zoom_scale,
-        #         (pygame.mouse.get_pos()[1] - self.pan_offset[1] - OFFSET_CENTER[1])  / self.zoom_scale)
-
-        # # READ THIS: zoom at mouse https://medium.com/@benjamin.botto/zooming-at-the-mouse-coordinates-with-affine-transformations-86e7312fd50b
-        # if factor > 1: 
-        #     sign = -1
-        # else:
-        #     sign = 1
-        # self.pan_offset = (self.pan_offset[0] + sign*current_zoom_pos[0], 
-        #                     self.pan_offset[1] + sign*current_zoom_pos[1])
-
-        # self.pan_offset = (self.pan_offset[0] - -1*(current_zoom_pos[0] - self.previous_zoom_pos[0]), 
-        #                     self.pan_offset[1] - -1*(current_zoom_pos[1] - self.previous_zoom_pos[1]))
+    # Zoom by factor, keeping image point under anchor (default: mouse) in place.
+    # https://medium.com/@benjamin.botto/zooming-at-the-mouse-coordinates-with-affine-transformations-86e7312fd50b
+    def increment_zoom(self, factor, anchor=None):
+        # Zoomed view only scales visible tiles, so zoom is clamped by scale rather than image size.
+        zoom_scale = min(max(self.zoom_scale * factor, MIN_ZOOM), MAX_ZOOM)
+        if zoom_scale == self.zoom_scale:
+            return False # cannot zoom in or out more
+        if anchor == None:
+            anchor = pygame.mouse.get_pos()
+
+        # Image topleft is at pan_offset + OFFSET_CENTER. Find image point under anchor, and move
+        # image so that point is still under anchor at new zoom.
+        ratio = zoom_scale / self.zoom_scale
+        pan_x = anchor[0] - OFFSET_CENTER[0] - (anchor[0] - OFFSET_CENTER[0] - self.pan_offset[0]) * ratio
+        pan_y = anchor[1] - OFFSET_CENTER[1] - (anchor[1] - OFFSET_CENTER[1] - self.pan_offset[1]) * ratio
+        # Keep an ongoing pan consistent with moved image.
+        self.pivot = (self.pivot[0] - (pan_x - self.pan_offset[0]), self.pivot[1] - (pan_y - self.pan_offset[1]))
+        self.pan_offset = (pan_x, pan_y)
+        self.zoom_scale = zoom_scale
+        return True
 
-        #self.previous_zoom_pos = current_zoom_pos
-        # self.previous_zoom_pos
-        
-        #self.pan_offset = ( (pygame.mouse.get_pos()[0] - self.pan_offset[0] - OFFSET_CENTER[0]) / self.zoom_scale,
-        #        (pygame.mouse.get_pos()[1] - self.pan_offset[1] - OFFSET_CENTER[1])  / self.zoom_scale)
+    # Window point to crop px (edge between pixels), at current pan and zoom.
+    def to_crop(self, point):
+        return (round((point[0] - OFFSET_CENTER[0] - self.pan_offset[0]) / self.zoom_scale),
+                round((point[1] - OFFSET_CENTER[1] - self.pan_offset[1]) / self.zoom_scale))
 
-        # perfect: zoom and pan https://stackoverflow.com/questions/41656176/tkinter-canvas-zoom-move-pan/48137257#48137257
+    def to_window(self, point):
+        return (round(point[0] * self.zoom_scale + self.pan_offset[0] + OFFSET_CENTER[0]),
+                round(point[1] * self.zoom_scale + self.pan_offset[1] + OFFSET_CENTER[1]))
 
     def set_pivot(self, point):
         pivot_x = point[0] - self.pan_offset[0]
         pivot_y = point[1] - self.pan_offset[1]
         self.pivot = (pivot_x, pivot_y)
 
+    # Corners are given in window coordinates and kept in full resolution capture coordinates.
     def set_left_upper(self, point):
-        self.crop_rectangle["left"], self.crop_rectangle["upper"] = point
+        self.crop_rectangle["left"], self.crop_rectangle["upper"] = self.to_capture(point)
 
     def set_right_lower(self, point):
-        self.crop_rectangle["right"], self.crop_rectangle["lower"] = point
-
-    def crop_pic(self, screen, filepath):
-        offset = self.window_info.get_window_position()
-        offset_left = offset["left"] + 8 # extra offset due to OS stuff
-        offset_upper = offset["upper"] + 1 # extra offset due to OS stuff
-
-        # make sure to crop original screen, without rectangle
-        screen.blit(self.screenshot_img, (0, 0))
-        pygame.display.flip()
-
-        # Then save crop
-        cropped = None
-        if self.set_corners():
-            # Valid rectangle cropped
-            cropped = ImageGrab.grab(bbox=(self.crop_rectangle["left"] + offset_left, 
-                                                self.crop_rectangle["upper"] + offset_upper + 30, # 30 is window bar size
-                                                self.crop_rectangle["right"] + offset_left, 
-                                                self.crop_rectangle["lower"] + offset_upper + 30))
+        self.crop_rectangle["right"], self.crop_rectangle["lower"] = self.to_capture(point)
+
+    # Crop is a slice of the full resolution in-memory capture; no second screen grab is needed.
+    # With several regions, all are cut from the same capture and shown side by side.
+    def crop_pic(self):
+        if self.set_corners() or not self.regions:
+            self.regions.append(dict(self.crop_rectangle))
+        if len(self.regions) == 1:
+            self.crop_rectangle = self.regions[0]
+            cropped = self.screenshot.crop(get_crop_box(self.crop_rectangle))
         else:
-            # invalid rectangle cropped (size 0). Just crop single pixel.
-            cropped = ImageGrab.grab(bbox=(0, 0, 1, 1))
-        cropped.save(filepath, 'PNG')
-        if read_setting() == "True":
-            self.save_to_clipboard(cropped)
-        self.cropped_img = self.load(filepath)
-        self.cropped_zoomed_img = self.cropped_img
-
-    # save to windows clipboard
-    def save_to_clipboard(self, img):    
-        output = BytesIO()
-        img.convert("RGB").save(output, "BMP")
-        data = output.getvalue()[14:]
-        output.close()
-
-        clip.OpenClipboard()
-        clip.EmptyClipboard()
-        clip.SetClipboardData(win32con.CF_DIB, data)
-        clip.CloseClipboard()
+            cropped = self.crop_regions()
+        self.set_cropped(cropped, self.load(cropped))
+        if get_settings().auto_copy:
+            self.save_to_clipboard()
+
+    # Crops of all regions, left to right in order selected, on one image.
+    def crop_regions(self):
+        crops = [self.screenshot.crop(get_crop_box(region)) for region in self.regions]
+        width = sum(crop.width for crop in crops) + REGION_GAP * (len(crops) - 1)
+        height = max(crop.height for crop in crops)
+        sheet = Image.new("RGB", (width, height), SCREEN_COLOR)
+        self.region_boxes = []
+        left = 0
+        for crop in crops:
+            sheet.paste(crop, (left, 0))
+            self.region_boxes.append((left, 0, left + crop.width, crop.height))
+            left += crop.width + REGION_GAP
+        return sheet
+
+    # Crop of each region (PIL image, with annotations) and its crop rectangle of capture.
+    def get_regions(self):
+        pic = self.get_pic()
+        if self.region_boxes == None:
+            return [(pic, self.crop_rectangle if self.captured else None)]
+        return [(pic.crop(box), region) for box, region in zip(self.region_boxes, self.regions)]
+
+    # Set crop as PIL image (for copy and export) and surface (for display).
+    def set_cropped(self, cropped_pic, cropped_img):
+        self.cropped_pic = cropped_pic
+        self.cropped_img = cropped_img
+        self.zoom_view = ZoomView(self.cropped_img, get_settings().memory_budget_mb * 1024 * 1024)
+        # Clipboard payload is encoded once per crop, in background.
+        self.clipboard_payload = None
+        # Annotations of crop surface, made on first annotation.
+        self.annotator = None
+
+    # Pick annotation tool (see annotate.TOOLS), or put it away if already picked.
+    def set_tool(self, tool):
+        self.tool = None if self.tool == tool else tool
+        self.annotation_start = None
+
+    # Start annotation box at window point.
+    def start_annotation(self, point):
+        self.annotation_start = self.to_crop(point)
+
+    # Annotate box from start to window point with current tool.
+    def finish_annotation(self, point):
+        start = self.annotation_start
+        self.annotation_start = None
+        if self.annotator == None:
+            from annotate import Annotator # loaded on first annotation, not at startup
+            self.annotator = Annotator(self.cropped_img)
+        self.show_annotation(self.annotator.apply(self.tool, start + self.to_crop(point)))
+
+    def undo_annotation(self):
+        if self.annotator != None:
+            self.show_annotation(self.annotator.undo())
+
+    # Annotation changed surface: drop scaled tiles, and PIL image of crop, which is now stale.
+    # History entry is replaced with the annotated crop, so stepping back never shows what was redacted.
+    def show_annotation(self, box):
+        if box == None:
+            return
+        self.zoom_view.invalidate()
+        self.cropped_pic = None
+        self.clipboard_payload = None
+        self.library_pending = True
+        if self.history_entry != None:
+            self.history_entry.set_image(self.get_pic())
+
+    # Crop with annotations (PIL image), for copy and export. Rebuilt from surface only if annotated since.
+    def get_pic(self):
+        if self.cropped_pic == None:
+            self.cropped_pic = Image.frombytes("RGB", self.cropped_img.get_size(), pygame.image.tobytes(self.cropped_img, "RGB"))
+        return self.cropped_pic
+
+    # Whether crop rectangle can be recorded (there is a screen position to record).
+    def can_record(self):
+        return self.state == State.CROPPED and self.captured and self.region_boxes == None
+
+    # Record crop rectangle of screen, in background, until stop_recording.
+    def start_recording(self):
+        settings = get_settings()
+        self.recording = None
+        self.recorder = Recorder(get_direct_source(self.source), get_crop_box(self.crop_rectangle),
+                                    settings.recording_fps, settings.recording_budget_mb * 1024 * 1024)
+        self.state = State.RECORDING
+
+    # Stop recording and keep frames for export. Returns error that stopped recording early, if any.
+    def stop_recording(self):
+        self.recording = self.recorder.stop()
+        error = self.recorder.error
+        self.recorder = None
+        self.state = State.CROPPED
+        return error
+
+    # Write recorded frames in background, as animation or frame folder (format "frames").
+    def export_recording(self, path, format):
+        get_worker().submit("export", self.recording.export, path, format)
+
+    # Only write to disk when user asks to export. Encoding and writing happen in background.
+    # Each region of a multi-region snip is written to its own numbered file, all in parallel.
+    def export(self, filepath):
+        if self.region_boxes == None:
+            get_worker().submit("export", self.get_pic().save, filepath, get_settings().export_format)
+            return
+        name, extension = os.path.splitext(filepath)
+        pic = self.get_pic()
+        for number, box in enumerate(self.region_boxes, 1):
+            get_worker().submit("export", lambda box, path: pic.crop(box).save(path, get_settings().export_format),
+                                box, "%s_%d%s" % (name, number, extension))
+
+    # Encoded clipboard payload (future), encoded on first use and reused by later copies.
+    def get_clipboard_payload(self):
+        pic = self.get_pic()
+        if self.clipboard_payload == None:
+            self.clipboard_payload = get_worker().submit("encode", encode_dib, pic)
+        return self.clipboard_payload
+
+    # save to clipboard, in background
+    def save_to_clipboard(self):
+        payload = self.get_clipboard_payload()
+        get_worker().submit("copy", lambda: get_clipboard().publish(payload.result()))
 
     # draws bounding rectangle of area to be cropped
-    def draw_rect(self, screen):
-        x, y = pygame.mouse.get_pos()
-        left = self.crop_rectangle["left"]
-        upper = self.crop_rectangle["upper"]
+    def draw_rect(self, screen, rect):
+        pygame.draw.rect(screen, RECT_COLOR, rect, width = 1)
+
+    # Rectangle from first corner to point.
+    def get_selection(self, point):
+        x, y = point
+        left, upper = self.preview.to_preview((self.crop_rectangle["left"], self.crop_rectangle["upper"]))
 
         # Specific swap for drawing rectangle to specify left vs right, up vs down, based on mins/max
         if left > x:
@@ -281,11 +525,8 @@ class Snip:
             temp = y
             y = upper
             upper = temp
+        return pygame.Rect(left, upper, x - left, y - upper)
 
-        # draw rectangle
-        rect_color = (220, 100, 150)
-        pygame.draw.rect(screen, rect_color, (left, upper, x - left, y - upper), width = 1)
-    
     # Swap rectangle corners to match description 
     # Returns whether rectangle is valid (not size of 0)
     def set_corners(self):
@@ -303,17 +544,31 @@ class Snip:
         self.crop_rectangle[one] = self.crop_rectangle[two]
         self.crop_rectangle[two] = temp
 
-    # change action and screen based on state
-    def update(self, screen):
-        if self.state == State.SNIPPING:
-            self.snip(screen)
-        elif self.state == State.CROPPING:
-            self.cropping(screen)
-        elif self.state == State.CROP:
-            self.crop(screen)
-        elif self.state == State.CROPPED:
-            self.cropped(screen)
-        
-        if self.state == State.CROPPED and self.window_state == State.PANNING:
-            self.set_pan_offset()
+    # Whether next frame can redraw only changed parts of window (snipping layers).
+    def can_redraw_partial(self):
+        return self.state in (State.SNIPPING, State.CROPPING) and self.state == self.drawn_state
 
+    # change action and screen based on state
+    # Returns rectangles of window that changed, or None if whole window was drawn.
+    def update(self, screen, full=True):
+        full = full or self.state != self.drawn_state
+        # Window resized while snipping: rebuild preview to fit it.
+        if self.state in (State.SNIPPING, State.CROPPING) and screen.get_size() != self.preview.window_size:
+            with stage("layers"):
+                self.build_layers(screen.get_size())
+            full = True
+        dirty = None
+        with stage(FRAME_STAGES[self.state]):
+            if self.state == State.SNIPPING:
+                dirty = self.snip(screen, full)
+            elif self.state == State.CROPPING:
+                dirty = self.cropping(screen, full)
+            elif self.state == State.CROP:
+                self.crop(screen)
+            elif self.state == State.CROPPED:
+                self.cropped(screen)
+            elif self.state == State.RECORDING:
+                self.cropped(screen)
+                pygame.draw.circle(screen, RECORD_COLOR, (screen.get_width() - 20, 50), 8)
+        self.drawn_state = self.state
+        return dirty
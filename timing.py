@@ -0,0 +1,97 @@
+import json
+import math
+import os
+import threading
+import time
+
+# Stage timings recorded into in-process histograms.
+# When disabled, stage() returns a shared no-op timer, so instrumented code costs a function call.
+enabled = os.environ.get("SNIPPY_TIMING", "") not in ("", "0")
+histograms = {}
+lock = threading.Lock()
+
+TIMING_FILE = "timing.txt"
+
+# Latency histogram with log spaced buckets (16 per doubling, ~4% wide) from 1 microsecond.
+class Histogram():
+    BUCKETS_PER_DOUBLING = 16
+    SMALLEST = 1e-6
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, seconds):
+        bucket = 0
+        if seconds > self.SMALLEST:
+            bucket = int(math.log2(seconds / self.SMALLEST) * self.BUCKETS_PER_DOUBLING)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    # Upper edge of bucket holding percentile (0-100), in seconds.
+    def percentile(self, percent):
+        target = self.count * percent / 100
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= target:
+                return min(self.max, self.SMALLEST * 2 ** ((bucket + 1) / self.BUCKETS_PER_DOUBLING))
+        return self.max
+
+class Timer():
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+class NullTimer():
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_TIMER = NullTimer()
+
+# Time a block: with stage("crop"): ...
+def stage(name):
+    if enabled:
+        return Timer(name)
+    return NULL_TIMER
+
+def record(name, seconds):
+    if not enabled:
+        return
+    with lock:
+        if name not in histograms:
+            histograms[name] = Histogram()
+        histograms[name].add(seconds)
+
+def enable(flag=True):
+    global enabled
+    enabled = flag
+
+# Percentiles (ms) of every stage recorded so far.
+def summary():
+    with lock:
+        return {name: {"count": histogram.count,
+                        "mean_ms": round(histogram.total / histogram.count * 1000, 3),
+                        "p50_ms": round(histogram.percentile(50) * 1000, 3),
+                        "p90_ms": round(histogram.percentile(90) * 1000, 3),
+                        "p99_ms": round(histogram.percentile(99) * 1000, 3),
+                        "max_ms": round(histogram.max * 1000, 3)}
+                for name, histogram in sorted(histograms.items())}
+
+def dump(path=TIMING_FILE):
+    with open(path, "w") as f:
+        json.dump(summary(), f, indent=1)
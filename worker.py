@@ -0,0 +1,41 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+from settings import get_settings
+from timing import stage
+
+# Posted when a background job finishes, with job name and error (None if succeeded).
+JOB_DONE = pygame.event.custom_type()
+
+# Runs encoding, file export and clipboard writes off the main loop.
+class Worker():
+    def __init__(self, workers=2):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="snippy")
+
+    # Run func(*args) in background. Returns future; JOB_DONE is posted when done.
+    def submit(self, job, func, *args):
+        future = self.pool.submit(self.run, job, func, *args)
+        future.add_done_callback(lambda done: self.post(job, done))
+        return future
+
+    def run(self, job, func, *args):
+        with stage(job):
+            return func(*args)
+
+    def post(self, job, future):
+        try:
+            pygame.event.post(pygame.event.Event(JOB_DONE, job=job, error=future.exception()))
+        except pygame.error:
+            pass # display already closed
+
+    # Wait for queued jobs (e.g. exports) to finish.
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+worker = None
+
+def get_worker():
+    global worker
+    if worker == None:
+        worker = Worker(get_settings().worker_count)
+    return worker
@@ -0,0 +1,214 @@
+import math
+from collections import OrderedDict
+
+import numpy
+import pygame
+from timing import stage
+
+# Approximate on-screen size (px) of one zoomed tile.
+TILE_SIZE = 256
+# Zoom is clamped by scale, not by image size - cost only depends on window size.
+MIN_ZOOM = 1 / 64
+MAX_ZOOM = 256
+# Wait this long (ms) after last zoom change before refining draft tiles.
+SETTLE_TIME = 150
+# Time (ms) per frame spent refining tiles, so the loop never blocks on it.
+REFINE_BUDGET = 8
+
+# Tile qualities.
+DRAFT = 0
+REFINED = 1
+
+# Pixel bytes of surface.
+def get_surface_bytes(surface):
+    return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+# Draws a zoomed image by scaling only the tiles visible in the window.
+# Zooming out scales from a pyramid of reduced copies (1/2, 1/4, ...) instead of the full image.
+# Scaled tiles and pyramid levels are kept in LRU caches so panning and zooming back are cheap.
+# Zoom is progressive: tiles are first drawn with a fast nearest neighbour draft, then once zoom
+# settles replaced a few per frame by refined tiles (smooth reduction, exact pixel replication).
+class ZoomView():
+    def __init__(self, image, tile_budget=64 * 1024 * 1024, max_levels=4):
+        self.image = image
+        self.max_levels = max_levels
+        self.levels = OrderedDict()
+        self.level_bytes = 0
+
+        # Scaled tiles keyed by (zoom, tile x, tile y, quality), evicted by bytes held
+        # (together with pyramid levels).
+        self.tile_budget = tile_budget
+        self.tiles = OrderedDict()
+        self.tile_bytes = 0
+
+        # Visible tiles still drawn as draft, and when zoom last changed.
+        self.pending = []
+        self.drawn_zoom = None
+        self.changed_time = 0
+
+    # Size of whole image at zoom.
+    def get_size(self, zoom):
+        return (round(self.image.get_width() * zoom), round(self.image.get_height() * zoom))
+
+    # Reduced copy of image at 1/2**level, built from the next larger level.
+    def get_level(self, level):
+        if level == 0:
+            return self.image
+        if level in self.levels:
+            self.levels.move_to_end(level)
+            return self.levels[level]
+        parent = self.get_level(level - 1)
+        size = (max(1, parent.get_width() // 2), max(1, parent.get_height() // 2))
+        surface = pygame.transform.smoothscale(parent, size)
+        self.levels[level] = surface
+        self.level_bytes += get_surface_bytes(surface)
+        if len(self.levels) > self.max_levels:
+            _, old = self.levels.popitem(last=False)
+            self.level_bytes -= get_surface_bytes(old)
+        return surface
+
+    # Pick pyramid level to scale from: the smallest level still at least as big as the zoomed image.
+    def choose_level(self, zoom):
+        level = 0
+        if zoom < 1:
+            level = int(math.floor(math.log2(1 / zoom)))
+            # stop before a level would collapse to a single pixel
+            smallest = min(self.image.get_width(), self.image.get_height())
+            level = max(0, min(level, int(math.log2(smallest)) if smallest > 1 else 0))
+        return level
+
+    # Level, its scale factors and tile size (in level px) used at zoom.
+    def layout(self, zoom):
+        level = self.choose_level(zoom)
+        source = self.get_level(level)
+        scale_x = zoom * self.image.get_width() / source.get_width()
+        scale_y = zoom * self.image.get_height() / source.get_height()
+        # tile covers about TILE_SIZE screen px, rounded to a power of two
+        tile = TILE_SIZE / max(scale_x, scale_y)
+        tile = 1 << max(0, min(10, int(math.floor(math.log2(tile))))) if tile >= 1 else 1
+        return source, scale_x, scale_y, tile
+
+    # Source rect (level px) and destination rect (zoomed px) of tile.
+    # Tile edges are rounded from shared source edges so neighbouring tiles never overlap or gap.
+    def get_tile_rects(self, source, scale_x, scale_y, tile, tile_x, tile_y):
+        src_left = tile_x * tile
+        src_top = tile_y * tile
+        src_right = min(src_left + tile, source.get_width())
+        src_bottom = min(src_top + tile, source.get_height())
+        dest_left = round(src_left * scale_x)
+        dest_top = round(src_top * scale_y)
+        src_rect = pygame.Rect(src_left, src_top, src_right - src_left, src_bottom - src_top)
+        dest_rect = pygame.Rect(dest_left, dest_top, round(src_right * scale_x) - dest_left, round(src_bottom * scale_y) - dest_top)
+        return src_rect, dest_rect
+
+    # Refined tile: smoothscale when reducing, exact pixel replication when magnifying.
+    def refine_tile(self, source, src_rect, dest_rect, scale_x, scale_y):
+        if scale_x <= 1 and scale_y <= 1:
+            return pygame.transform.smoothscale(source.subsurface(src_rect), dest_rect.size)
+        # Each zoomed px samples the source px under its center, in whole image coordinates,
+        # so every source px becomes a block of the same size (+-1px) across all tiles.
+        columns = ((numpy.arange(dest_rect.left, dest_rect.right) + 0.5) / scale_x).astype(numpy.intp)
+        rows = ((numpy.arange(dest_rect.top, dest_rect.bottom) + 0.5) / scale_y).astype(numpy.intp)
+        columns = numpy.clip(columns, src_rect.left, src_rect.right - 1) - src_rect.left
+        rows = numpy.clip(rows, src_rect.top, src_rect.bottom - 1) - src_rect.top
+        pixels = pygame.surfarray.array3d(source.subsurface(src_rect))
+        return pygame.surfarray.make_surface(pixels[numpy.ix_(columns, rows)])
+
+    # Keep tile, converted to display pixel format so drawing it each frame is a plain copy
+    # (image itself may be 24-bit). Returns converted tile.
+    def cache_tile(self, key, tile):
+        tile = tile.convert()
+        self.tiles[key] = tile
+        self.tile_bytes += get_surface_bytes(tile)
+        # Evict least recently used tiles past budget.
+        while self.get_bytes() > self.tile_budget and len(self.tiles) > 1:
+            _, old = self.tiles.popitem(last=False)
+            self.tile_bytes -= get_surface_bytes(old)
+        return tile
+
+    def drop_tile(self, key):
+        if key in self.tiles:
+            self.tile_bytes -= get_surface_bytes(self.tiles.pop(key))
+
+    # Bytes held by scaled tiles and pyramid levels (not the image itself).
+    def get_bytes(self):
+        return self.tile_bytes + self.level_bytes
+
+    # Best cached tile, or a new draft. Returns tile and whether it still needs refining.
+    def get_tile(self, key, source, src_rect, dest_rect, exact):
+        refined_key = key + (REFINED,)
+        if refined_key in self.tiles:
+            self.tiles.move_to_end(refined_key)
+            return self.tiles[refined_key], False
+        draft_key = key + (DRAFT,)
+        if draft_key in self.tiles:
+            self.tiles.move_to_end(draft_key)
+            return self.tiles[draft_key], not exact
+        with stage("zoom_tile"):
+            tile = pygame.transform.scale(source.subsurface(src_rect), dest_rect.size)
+        return self.cache_tile(draft_key, tile), not exact
+
+    # Forget scaled tiles and pyramid levels after image pixels changed (e.g. annotated).
+    # Only tiles in the window are scaled again on next draw; levels when next zoomed out.
+    def invalidate(self):
+        self.levels.clear()
+        self.level_bytes = 0
+        self.tiles.clear()
+        self.tile_bytes = 0
+        self.pending = []
+
+    # Whether draft tiles are waiting to be refined.
+    def refining(self):
+        return len(self.pending) > 0
+
+    # Replace pending draft tiles by refined ones, for at most budget ms, once zoom settled.
+    def refine(self, budget=REFINE_BUDGET):
+        start = pygame.time.get_ticks()
+        if not self.pending or start - self.changed_time < SETTLE_TIME:
+            return
+        while self.pending and pygame.time.get_ticks() - start < budget:
+            key, source, src_rect, dest_rect, scale_x, scale_y = self.pending.pop(0)
+            if key[0] != self.drawn_zoom or key + (REFINED,) in self.tiles:
+                continue
+            with stage("zoom_refine"):
+                tile = self.refine_tile(source, src_rect, dest_rect, scale_x, scale_y)
+            self.drop_tile(key + (DRAFT,))
+            self.cache_tile(key + (REFINED,), tile)
+
+    # Draw image at zoom with its topleft at position, only touching tiles inside screen.
+    def draw(self, screen, position, zoom):
+        if zoom != self.drawn_zoom:
+            self.drawn_zoom = zoom
+            self.changed_time = pygame.time.get_ticks()
+        self.refine()
+        self.pending = []
+
+        position = (round(position[0]), round(position[1]))
+        source, scale_x, scale_y, tile = self.layout(zoom)
+        width, height = source.get_size()
+        zoomed_width, zoomed_height = self.get_size(zoom)
+        # Unscaled tiles are exact already.
+        exact = scale_x == 1 and scale_y == 1
+
+        # Visible part of zoomed image, in zoomed px.
+        view = pygame.Rect(-position[0], -position[1], screen.get_width(), screen.get_height())
+        view = view.clip(pygame.Rect(0, 0, zoomed_width, zoomed_height))
+        if view.width == 0 or view.height == 0:
+            return
+
+        # Visible tiles, in tile index.
+        first_x = int(view.left / scale_x) // tile
+        last_x = min(width - 1, int(math.ceil(view.right / scale_x))) // tile
+        first_y = int(view.top / scale_y) // tile
+        last_y = min(height - 1, int(math.ceil(view.bottom / scale_y))) // tile
+
+        for tile_y in range(first_y, last_y + 1):
+            for tile_x in range(first_x, last_x + 1):
+                src_rect, dest_rect = self.get_tile_rects(source, scale_x, scale_y, tile, tile_x, tile_y)
+                if dest_rect.width <= 0 or dest_rect.height <= 0:
+                    continue
+                key = (zoom, tile_x, tile_y)
+                surface, needs_refine = self.get_tile(key, source, src_rect, dest_rect, exact)
+                if needs_refine:
+                    self.pending.append((key, source, src_rect, dest_rect, scale_x, scale_y))
+                screen.blit(surface, (position[0] + dest_rect.left, position[1] + dest_rect.top))